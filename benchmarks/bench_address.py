@@ -0,0 +1,64 @@
+"""Startup and per-label cost of country names and address formatting.
+
+Compares the bundled German country table with looking every country up
+in pycountry, as labels did before.
+
+Usage: python benchmarks/bench_address.py [labels]
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+from common import ORDER, ROOT
+
+import run
+
+# What get_country_name does on its first call, now and before
+FIRST_LOOKUP = {
+    'country table': f"import json; json.load(open({run.COUNTRY_NAMES_FILE!r}, encoding='utf-8'))['DE']",
+    'pycountry': "import pycountry; pycountry.countries.get(alpha_2='DE').name",
+}
+
+
+def startup_seconds(code: str, repeat: int = 5) -> float:
+    """Median wall time of a fresh interpreter running ``code``."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def pycountry_lines(shipping: dict) -> list[str]:
+    import pycountry
+    country = pycountry.countries.get(alpha_2=shipping['country'])
+    return [
+        f"{shipping['first_name']} {shipping['last_name']}",
+        shipping['address_1'],
+        f"{shipping['postcode']} {shipping['city']}",
+        country.name if country else '',
+    ]
+
+
+def main():
+    labels = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    baseline = startup_seconds('pass')
+    print(f'{"interpreter":>14}: {baseline * 1000:7.1f} ms')
+    for name, code in FIRST_LOOKUP.items():
+        print(f'{name:>14}: {(startup_seconds(code) - baseline) * 1000:7.1f} ms until the first country name')
+
+    countries = ['DE', 'AT', 'CH', 'NL', 'GB', 'FR', 'US', 'DK']
+    shippings = [dict(ORDER['shipping'], country=countries[index % len(countries)]) for index in range(labels)]
+    for name, format_lines in (('country table', run.format_address), ('pycountry', pycountry_lines)):
+        format_lines(shippings[0])
+        start = time.perf_counter()
+        for shipping in shippings:
+            format_lines(shipping)
+        seconds = time.perf_counter() - start
+        print(f'{name:>14}: {seconds / labels * 1e6:7.2f} µs per label')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Download throughput against the local image server stand-in.
+
+Compares the previous approach (new connection per request, 1 KiB
+chunks) with ``fetch_image`` and shows the cost of an interrupted
+transfer with and without Range support.
+
+Usage: python benchmarks/bench_download.py [size_mb] [downloads]
+"""
+import os
+import sys
+import time
+
+import requests
+
+import common  # noqa: F401  (puts the repository and tests on sys.path)
+from image_server import ImageServer
+
+import run
+
+
+def previous_fetch(url: str) -> bytes:
+    response = requests.get(url, stream=True)
+    return b"".join(response.iter_content(1024))
+
+
+def timed(label: str, size: int, count: int, func, server: ImageServer):
+    requests_before = len(server.requests)
+    start = time.perf_counter()
+    for _ in range(count):
+        assert len(func()) == size
+    elapsed = time.perf_counter() - start
+    print(
+        f'{label:>36}: {size * count / elapsed / 1024 / 1024:8.1f} MiB/s, '
+        f'{elapsed / count * 1000:8.1f} ms/download, '
+        f'{len(server.requests) - requests_before} requests'
+    )
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 50
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    data = run.PNG_SIGNATURE + os.urandom(int(size_mb * 1024 * 1024) - len(run.PNG_SIGNATURE))
+    print(f'{count} downloads of {len(data) / 1024 / 1024:.1f} MiB')
+
+    with ImageServer({'/image.png': data}) as server:
+        url = f'{server.url}/image.png'
+        timed('requests.get, 1 KiB chunks', len(data), count, lambda: previous_fetch(url), server)
+        timed('fetch_image', len(data), count, lambda: run.fetch_image(url), server)
+
+        def interrupted():
+            server.failures = ['truncate']
+            return run.fetch_image(url, delay=0)
+
+        timed('fetch_image, interrupted', len(data), count, interrupted, server)
+
+    with ImageServer({'/image.png': data}, support_range=False) as server:
+        url = f'{server.url}/image.png'
+
+        def interrupted_without_range():
+            server.failures = ['truncate']
+            return run.fetch_image(url, delay=0)
+
+        timed('fetch_image, interrupted, no Range', len(data), count, interrupted_without_range, server)
+
+
+if __name__ == '__main__':
+    main()
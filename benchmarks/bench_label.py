@@ -0,0 +1,74 @@
+"""Compare the vector and raster modes of ``add_label_to_pdf``.
+
+Also measures labels/second of ``label_document`` with the shared label
+template and with a template compiled for every label, as before the
+template cache.
+
+Usage: python benchmarks/bench_label.py [pages] [width_px] [height_px]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from common import LABEL_SETTINGS, ORDER, make_png, run_isolated
+
+import run
+
+
+def label_pdf(input_pdf: str, output_pdf: str, mode: str) -> int:
+    run.add_label_to_pdf(input_pdf, output_pdf, ORDER, dict(LABEL_SETTINGS, label_mode=mode))
+    return os.path.getsize(output_pdf)
+
+
+def labels_per_second(mode: str, cached: bool, seconds: float = 2.0) -> float:
+    settings = dict(LABEL_SETTINGS, label_mode=mode)
+    doc = run.png_to_document(make_png(2000, 1000), 150)
+    labels = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        if not cached:
+            run._compile_label_template.cache_clear()
+        run.label_document(doc, ORDER, settings).close()
+        labels += 1
+    return labels / (time.perf_counter() - start)
+
+
+def build_input(directory: str, pages: int, width: int, height: int) -> str:
+    png_path = os.path.join(directory, 'input.png')
+    Image.effect_noise((width, height), 64).convert('RGB').save(png_path)
+    pdf_path = os.path.join(directory, 'input.pdf')
+    frames = [Image.open(png_path).convert('RGB') for _ in range(pages)]
+    frames[0].save(pdf_path, resolution=150, save_all=True, append_images=frames[1:])
+    return pdf_path
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    height = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_pdf = build_input(directory, pages, width, height)
+        print(f'{pages} page(s) of {width}x{height} px')
+        for mode in ('vector', 'raster'):
+            output_pdf = os.path.join(directory, f'{mode}.pdf')
+            size, seconds, peak_rss_kb = run_isolated(label_pdf, input_pdf, output_pdf, mode)
+            print(
+                f'{mode:>6}: {seconds / pages * 1000:8.1f} ms/page, '
+                f'peak RSS {peak_rss_kb / 1024:7.1f} MiB, '
+                f'output {size / 1024 / 1024:6.1f} MiB'
+            )
+
+    print('\nlabel_document on a 2000x1000 px page')
+    for mode in ('vector', 'raster'):
+        for cached in (False, True):
+            rate, _, _ = run_isolated(labels_per_second, mode, cached)
+            template = 'shared template' if cached else 'template per label'
+            print(f'{mode:>6}, {template:>18}: {rate:8.1f} labels/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Compare order lookups against a database with many historical orders.
+
+The "scan" numbers reproduce the previous ``get_order`` that loaded the
+whole ``orders`` table per lookup. The dashboard numbers page through the
+history with ``list_orders`` and, for comparison, with LIMIT/OFFSET.
+
+Usage: python benchmarks/bench_order_store.py [orders] [lookups]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repository on sys.path)
+
+import run
+
+
+def scan_lookup(order_id: int):
+    for order_db in run.get_orders():
+        if order_db['id'] == order_id:
+            return order_db
+    return None
+
+
+def timed(label: str, count: int, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:>28}: {elapsed * 1000:9.2f} ms total, {elapsed / count * 1e6:10.1f} us/op')
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    with tempfile.TemporaryDirectory() as directory:
+        run.DB_NAME = os.path.join(directory, 'orders.db')
+        run.create_db(run.DB_NAME)
+        conn = run.get_db()
+        with conn:
+            conn.executemany(
+                "INSERT INTO orders (id, status, created_at) VALUES (?, 1, datetime(1700000000 + ? * 60, 'unixepoch'))",
+                ((order_id, order_id) for order_id in range(orders)),
+            )
+        print(f'{orders} orders in the database, {lookups} lookups')
+
+        ids = list(range(orders - lookups, orders + lookups, 2))
+        timed('full table scan', len(ids), lambda: [scan_lookup(i) for i in ids])
+        timed('primary key lookup', len(ids), lambda: [run.get_order({'id': i}) for i in ids])
+        timed('batch IN query', len(ids), lambda: run.get_known_order_ids(ids))
+        new_ids = range(orders, orders + lookups)
+        _, cursor = run.list_orders(limit=orders // 2)
+        timed('dashboard first page', lookups, lambda: [run.list_orders() for _ in range(lookups)])
+        timed('dashboard middle page', lookups, lambda: [run.list_orders(after=cursor) for _ in range(lookups)])
+        timed('middle page by OFFSET', lookups, lambda: [conn.execute(
+            "SELECT id, status, created_at FROM orders ORDER BY created_at DESC, id DESC LIMIT 50 OFFSET ?",
+            (orders // 2,),
+        ).fetchall() for _ in range(lookups)])
+        timed('upsert', len(new_ids), lambda: [run.upsert_order({'id': i}, True) for i in new_ids])
+
+
+if __name__ == '__main__':
+    main()
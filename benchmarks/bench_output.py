@@ -0,0 +1,84 @@
+"""File size and save time of final PDFs for the bundled cut files.
+
+"previous" is the former output: lossless artwork and a plain ``save()``
+(``garbage=3, deflate=True`` for several copies in one file).
+The other variants use ``pdf_save_options`` with the given
+``PDF_IMAGE_ENCODING``. Every variant renders a photo-like artwork the
+size of the cut file at 150 DPI, with ``--copies`` pages per file.
+
+Usage: python benchmarks/bench_output.py [--copies N] [--quality Q] [--repeat N]
+"""
+import argparse
+import io
+import os
+import time
+
+from PIL import Image
+
+from common import CUT_FILES, LABEL_SETTINGS, ORDER
+
+import fitz
+import run
+
+VARIANTS = {
+    'previous': ('flate', False),
+    'optimized': ('flate', True),
+    'jpeg': ('jpeg', True),
+    'auto': ('auto', True),
+}
+
+
+def make_artwork(width: int, height: int) -> bytes:
+    """Return a PNG with smooth gradients and grain, like a photo of a skin design."""
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    grain = Image.effect_noise((width, height), 12).convert('RGB')
+    buffer = io.BytesIO()
+    Image.blend(gradient, grain, 0.3).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def measure(png_data: bytes, cut_file: str, copies: int, repeat: int) -> tuple[float, float, int]:
+    """Return the best render and save times and the file size."""
+    options = run.pdf_save_options()
+    if not options and copies > 1:
+        options = {'garbage': 3, 'deflate': True}
+    render_times, save_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        doc = run.render_item(png_data, 150, ORDER, LABEL_SETTINGS, cut_file)
+        if copies > 1:
+            run._append_copies_as_pages(doc, copies)
+        render_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        data = doc.tobytes(**options)
+        save_times.append(time.perf_counter() - start)
+        doc.close()
+    return min(render_times), min(save_times), len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--copies', type=int, default=1)
+    parser.add_argument('--quality', type=int, default=run.PDF_JPEG_QUALITY)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run.PDF_JPEG_QUALITY = args.quality
+
+    for cut_file in CUT_FILES:
+        with fitz.open(cut_file) as cut:
+            rect = cut[0].rect
+        png_data = make_artwork(int(rect.width / 72 * 150), int(rect.height / 72 * 150))
+        print(f'{os.path.basename(cut_file)}: artwork {len(png_data) / 1e6:.1f} MB, {args.copies} copies')
+        baseline = None
+        for name, (encoding, optimize) in VARIANTS.items():
+            run.PDF_IMAGE_ENCODING, run.PDF_OPTIMIZE = encoding, optimize
+            render_seconds, save_seconds, size = measure(png_data, cut_file, args.copies, args.repeat)
+            baseline = baseline or size
+            print(
+                f'{name:>12}: {size / 1e6:7.2f} MB ({size / baseline:6.1%}),'
+                f' render {render_seconds * 1000:6.1f} ms, save {save_seconds * 1000:6.1f} ms'
+            )
+
+
+if __name__ == '__main__':
+    main()
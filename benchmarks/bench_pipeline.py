@@ -0,0 +1,213 @@
+"""Reproducible benchmark of the order-to-hotfolder pipeline.
+
+Runs without network access: orders and products come from a fake
+WooCommerce API, the artwork from a local image server, and the real
+cut files and fonts of the repository are used. Every scenario runs in a
+fresh process so its peak RSS, including the render workers, can be
+reported.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--orders 1 50 500] [--size 4490x2006]
+        [--workers 1] [--output results.json] [--compare previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from common import (
+    CUT_FILES,
+    LABEL_SETTINGS,
+    ORDER,
+    ROOT,
+    FakeWooCommerceAPI,
+    make_orders,
+    make_png,
+    run_isolated,
+    summarize,
+)
+from image_server import ImageServer
+
+import run
+
+
+def bench_stages(width: int, height: int, repeat: int) -> dict:
+    png = make_png(width, height)
+    samples = {stage: [] for stage in ('png_to_pdf', 'add_label_to_pdf', 'merge_cut_file', 'hotfolder_write')}
+    with tempfile.TemporaryDirectory() as directory:
+        for index in range(repeat):
+            start = time.perf_counter()
+            doc = run.png_to_document(png, 150)
+            samples['png_to_pdf'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            labelled = run.label_document(doc, ORDER, LABEL_SETTINGS)
+            samples['add_label_to_pdf'].append(time.perf_counter() - start)
+            doc.close()
+
+            start = time.perf_counter()
+            run.merge_cut_document(labelled, run.open_cut_file(CUT_FILES[index % len(CUT_FILES)]))
+            samples['merge_cut_file'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            run.save_pdf_atomic(labelled, os.path.join(directory, 'final.pdf'))
+            samples['hotfolder_write'].append(time.perf_counter() - start)
+            labelled.close()
+    return {stage: summarize(values) for stage, values in samples.items()}
+
+
+def bench_database(orders: int, repeat: int) -> dict:
+    samples = {stage: [] for stage in ('sqlite_upsert_order', 'sqlite_get_order', 'sqlite_get_known_order_ids')}
+    with tempfile.TemporaryDirectory() as directory:
+        run.DB_NAME = os.path.join(directory, 'orders.db')
+        run.create_db(run.DB_NAME)
+        conn = run.get_db()
+        with conn:
+            conn.executemany("INSERT INTO orders (id, status) VALUES (?, 1)", ((i,) for i in range(orders)))
+        for index in range(repeat):
+            order = {'id': orders + index}
+            start = time.perf_counter()
+            run.upsert_order(order, True)
+            samples['sqlite_upsert_order'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            run.get_order(order)
+            samples['sqlite_get_order'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            run.get_known_order_ids(range(index * 100, index * 100 + 100))
+            samples['sqlite_get_known_order_ids'].append(time.perf_counter() - start)
+    return {stage: summarize(values) for stage, values in samples.items()}
+
+
+def bench_order_check(order_count: int, width: int, height: int, workers: int) -> dict:
+    png = make_png(width, height)
+    orders = make_orders(order_count)
+    files = {
+        f"/Order/order-{order['id']}/item-{item['id']}.png": png
+        for order in orders for item in order['line_items']
+    }
+    api = FakeWooCommerceAPI(orders, range(4))
+
+    latencies = []
+    print_order = run.print_order
+
+    def timed_print_order(*args, **kwargs):
+        start = time.perf_counter()
+        print_order(*args, **kwargs)
+        latencies.append(time.perf_counter() - start)
+
+    run.print_order = timed_print_order
+    run.WOOCOMMERCE_API = api
+    run.CUTS_DIR = os.path.join(ROOT, 'cuts')
+    # Deliver every order, a full hotfolder would hold the rest back
+    run.HOTFOLDER_MAX_FILES = run.HOTFOLDER_MAX_BYTES = 0
+    # Keep the per order log lines out of the report
+    run.log = lambda message, **fields: None
+
+    with tempfile.TemporaryDirectory() as directory, ImageServer(files) as server:
+        run.DB_NAME = os.path.join(directory, 'orders.db')
+        run.create_db(run.DB_NAME)
+        run.STAGING_PATH = os.path.join(directory, 'staging')
+        # Every order uses the same artwork, measure cold renders only
+        run.RENDER_CACHE_PATH = os.path.join(directory, 'render_cache')
+        run.RENDER_CACHE_SIZE = 0
+        hotfolder = os.path.join(directory, 'hotfolder')
+        os.makedirs(hotfolder)
+
+        start = time.perf_counter()
+        run.order_check(api, LABEL_SETTINGS, hotfolder, server.url, workers, 'files', True)
+        seconds = time.perf_counter() - start
+
+        delivered = len(os.listdir(hotfolder))
+    # Worker processes would keep this process from exiting
+    for executor in run._EXECUTORS.values():
+        executor.shutdown()
+    assert delivered == order_count, f'{delivered} of {order_count} orders delivered'
+    return {
+        'orders': order_count,
+        'seconds': seconds,
+        'orders_per_second': order_count / seconds,
+        'latency': summarize(latencies),
+        'api_requests': api.requests,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, previous: dict) -> None:
+    print('\nChange against', previous.get('commit') or 'previous run')
+    for name, scenario in results['order_check'].items():
+        before = previous.get('order_check', {}).get(name)
+        if before:
+            ratio = scenario['orders_per_second'] / before['orders_per_second']
+            print(f'  order_check {name:>5} orders: throughput x{ratio:.2f}')
+    for stage, summary in results['stages'].items():
+        before = previous.get('stages', {}).get(stage)
+        if before:
+            print(f'  {stage:>28}: p50 {before["p50_ms"]:8.1f} -> {summary["p50_ms"]:8.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, nargs='+', default=[1, 50, 500])
+    parser.add_argument('--size', default='4490x2006', help='artwork size in pixels')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=10, help='samples per stage')
+    parser.add_argument('--output', help='JSON file, default benchmarks/results/pipeline-<time>.json')
+    parser.add_argument('--compare', help='JSON file of an earlier run')
+    args = parser.parse_args()
+    width, height = map(int, args.size.split('x'))
+
+    results = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'size': args.size,
+        'workers': args.workers,
+        'stages': {},
+        'order_check': {},
+    }
+
+    stages, seconds, peak_rss_kb = run_isolated(bench_stages, width, height, args.repeat)
+    database, _, _ = run_isolated(bench_database, 100_000, args.repeat)
+    results['stages'] = {**stages, **database}
+    results['stages_peak_rss_mb'] = peak_rss_kb / 1024
+    for stage, summary in results['stages'].items():
+        print(f'{stage:>28}: p50 {summary["p50_ms"]:8.1f} ms, p95 {summary["p95_ms"]:8.1f} ms')
+
+    for order_count in args.orders:
+        scenario, _, peak_rss_kb = run_isolated(bench_order_check, order_count, width, height, args.workers)
+        scenario['peak_rss_mb'] = peak_rss_kb / 1024
+        results['order_check'][str(order_count)] = scenario
+        print(
+            f'order_check {order_count:>5} orders: {scenario["orders_per_second"]:7.2f} orders/s, '
+            f'p50 {scenario["latency"]["p50_ms"]:8.1f} ms, p95 {scenario["latency"]["p95_ms"]:8.1f} ms, '
+            f'peak RSS {scenario["peak_rss_mb"]:7.1f} MiB'
+        )
+
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(results, json.load(previous_file))
+
+
+if __name__ == '__main__':
+    main()
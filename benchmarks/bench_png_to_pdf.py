@@ -0,0 +1,61 @@
+"""Wall time and peak memory of ``png_to_document`` across image sizes.
+
+"previous" is the former implementation that converted the image with
+PIL and let PIL encode the PDF.
+
+Usage: python benchmarks/bench_png_to_pdf.py [megapixels ...]
+"""
+import os
+import sys
+import tempfile
+
+from PIL import Image
+
+from common import run_isolated
+
+import run
+
+
+def previous_png_to_pdf(png_path: str, pdf_path: str, dpi: int = 150):
+    image = Image.open(png_path)
+    rgb_image = image.convert('RGB')
+    rgb_image.save(pdf_path, resolution=dpi)
+
+
+def convert(implementation: str, png_path: str, pdf_path: str) -> int:
+    if implementation == 'previous':
+        previous_png_to_pdf(png_path, pdf_path)
+    else:
+        run.png_to_pdf(png_path, pdf_path)
+    return os.path.getsize(pdf_path)
+
+
+def build_png(path: str, megapixels: float, mode: str):
+    width = int((megapixels * 1e6 * 2) ** 0.5)
+    height = int(megapixels * 1e6 / width)
+    image = Image.effect_noise((width, height), 32).convert('RGB')
+    if mode == 'RGBA':
+        image.putalpha(255)
+    image.save(path)
+
+
+def main():
+    sizes = [float(size) for size in sys.argv[1:]] or [2, 8, 24]
+    with tempfile.TemporaryDirectory() as directory:
+        for megapixels in sizes:
+            for mode in ('RGB', 'RGBA'):
+                png_path = os.path.join(directory, f'{megapixels}-{mode}.png')
+                build_png(png_path, megapixels, mode)
+                png_size = os.path.getsize(png_path)
+                for implementation in ('previous', 'current'):
+                    pdf_path = os.path.join(directory, f'{implementation}.pdf')
+                    pdf_size, seconds, peak_rss_kb = run_isolated(convert, implementation, png_path, pdf_path)
+                    print(
+                        f'{megapixels:5.1f} MP {mode:<4} {implementation:>8}: '
+                        f'{seconds * 1000:8.1f} ms, peak RSS {peak_rss_kb / 1024:7.1f} MiB, '
+                        f'PNG {png_size / 1024 / 1024:6.1f} MiB -> PDF {pdf_size / 1024 / 1024:6.1f} MiB'
+                    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Helpers shared by the benchmark scripts in this directory."""
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import traceback
+from queue import Empty
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'tests'))
+
+CUT_FILES = sorted(
+    os.path.join(ROOT, 'cuts', name) for name in os.listdir(os.path.join(ROOT, 'cuts'))
+)
+
+LABEL_SETTINGS = {
+    'text_font_path': 'fonts/roboto.ttf',
+    'text_bold_font_path': 'fonts/Roboto-Bold.ttf',
+    'text_font_size': '9',
+    'text_sender_pos': '150, 50',
+    'text_receiver_pos': '150, 230',
+    'sender_name': 'Drohnen-Design',
+    'sender_street': 'Herrenstraße 14',
+    'sender_postalcode': '21698',
+    'sender_city': 'Harsefeld',
+    'sender_country': 'Deutschland',
+}
+
+ORDER = {
+    'id': 1000,
+    'shipping': {
+        'first_name': 'Erika',
+        'last_name': 'Musterfrau',
+        'address_1': 'Musterstraße 1',
+        'postcode': '12345',
+        'city': 'Musterstadt',
+        'country': 'DE',
+    },
+}
+
+
+def _isolated_worker(queue, func, args):
+    try:
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+    except BaseException:
+        queue.put((None, traceback.format_exc()))
+        return
+    # Render workers are child processes, count the largest one that ended
+    peak_rss_kb = (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    queue.put(((result, elapsed, peak_rss_kb), None))
+
+
+def run_isolated(func, *args):
+    """Run ``func(*args)`` in a fresh process.
+
+    Returns ``(result, seconds, peak_rss_kb)``. A fresh process is needed
+    because the peak RSS reported by the kernel never goes down again.
+    The peak RSS adds the largest child process that has exited, such as
+    a render worker, to the peak of the process itself. Raises
+    ``RuntimeError`` when ``func`` fails or the process dies.
+    """
+
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_isolated_worker, args=(queue, func, args))
+    process.start()
+    while True:
+        # Checked before waiting, a result sent right before the end still arrives
+        alive = process.is_alive()
+        try:
+            result, error = queue.get(timeout=1)
+            break
+        except Empty:
+            if not alive:
+                raise RuntimeError(f'{func.__name__} died with exit code {process.exitcode}') from None
+    process.join()
+    if error:
+        raise RuntimeError(f'{func.__name__} failed:\n{error}')
+    return result
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """Return the ``fraction`` percentile of ``samples`` (nearest rank)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Summarize latency ``samples`` in seconds."""
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'total_seconds': total,
+        'per_second': len(samples) / total if total else 0.0,
+        'p50_ms': percentile(samples, 0.5) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+    }
+
+
+def make_png(width: int, height: int) -> bytes:
+    """Return a noisy RGB PNG, which compresses about as badly as a photo."""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 24).convert('RGB').save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+class FakeResponse:
+    def __init__(self, data, headers=None):
+        self._data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self._data
+
+
+class FakeWooCommerceAPI:
+    """Answer the WooCommerce requests made by run.py from memory.
+
+    Every product prints on one of the bundled cut files at 150 DPI.
+    """
+
+    def __init__(self, orders: list[dict], products: list[int]):
+        self.orders = orders
+        self.products = {
+            product_id: {
+                'id': product_id,
+                'meta_data': [
+                    {'key': 'druck-id', 'value': os.path.basename(CUT_FILES[product_id % len(CUT_FILES)])},
+                    {'key': '_dvpd_dpi', 'value': '150'},
+                ],
+            }
+            for product_id in products
+        }
+        self.requests = 0
+
+    def get(self, endpoint, params=None):
+        self.requests += 1
+        if endpoint == 'orders':
+            params = params or {}
+            per_page = params.get('per_page', 10)
+            page = params.get('page', 1)
+            pages = max(1, -(-len(self.orders) // per_page))
+            return FakeResponse(
+                self.orders[(page - 1) * per_page:page * per_page],
+                {'X-WP-Total': str(len(self.orders)), 'X-WP-TotalPages': str(pages)},
+            )
+        if endpoint == 'products':
+            ids = [int(product_id) for product_id in params['include'].split(',')]
+            return FakeResponse([self.products[product_id] for product_id in ids])
+        return FakeResponse(self.products[int(endpoint.split('/')[1])])
+
+
+def make_orders(count: int, products: int = 4, first_id: int = 1) -> list[dict]:
+    """Return ``count`` paid orders with one line item each."""
+    return [
+        {
+            **ORDER,
+            'id': order_id,
+            'status': 'processing',
+            'date_modified_gmt': f'2025-09-14T{order_id // 3600 % 24:02d}:{order_id // 60 % 60:02d}:{order_id % 60:02d}',
+            'line_items': [{'id': order_id * 10, 'product_id': order_id % products, 'quantity': 1}],
+        }
+        for order_id in range(first_id, first_id + count)
+    ]
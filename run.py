@@ -1,73 +1,468 @@
+import asyncio
 import base64
+import bisect
+import hashlib
+import hmac
 import io
+import json
+import multiprocessing
 import os
+import queue
+import random
+import re
 import time
+import shutil
+import socket
 import sqlite3
-import requests
+import struct
+import threading
 import traceback
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from urllib.parse import parse_qs, urlencode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import (
+    Executor,
+    Future,
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait,
+)
 
 import fitz
-import pycountry
+import httpx
 from PIL import Image, ImageDraw, ImageFont
 from dotenv import load_dotenv
 from woocommerce import API
 
 
-# Cache for WooCommerce product data to avoid repeated API requests
-PRODUCT_CACHE: dict[int, dict] = {}
+# Cache for WooCommerce product data to avoid repeated API requests. Entries
+# map the product ID to the time the product was fetched and its data, in
+# least recently used order. The cache is backed by the products table.
+PRODUCT_CACHE: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+PRODUCT_CACHE_TTL = 3600  # seconds until a product is fetched again
+PRODUCT_CACHE_SIZE = 1024  # products kept in memory
+PRODUCT_CACHE_STATS = {'hits': 0, 'misses': 0}
 
 
+# Upper bounds in seconds of the stage duration histogram buckets
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+JSON_LOGS = False  # log JSON lines instead of plain text
+
+# Stage durations as {stage: [bucket counts..., +Inf count]}, sums and
+# counters as {(name, labels): value}; all guarded by _METRICS_LOCK
+_HISTOGRAMS: dict[str, list[int]] = {}
+_HISTOGRAM_SUMS: dict[str, float] = {}
+_COUNTERS: dict[tuple[str, tuple], float] = {}
+# Current values such as queue depths, only set by the main process
+_GAUGES: dict[tuple[str, tuple], float] = {}
+_METRICS_LOCK = threading.Lock()
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record that ``stage`` took ``seconds``."""
+    index = bisect.bisect_left(METRICS_BUCKETS, seconds)
+    with _METRICS_LOCK:
+        buckets = _HISTOGRAMS.setdefault(stage, [0] * (len(METRICS_BUCKETS) + 1))
+        buckets[index] += 1
+        _HISTOGRAM_SUMS[stage] = _HISTOGRAM_SUMS.get(stage, 0.0) + seconds
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    """Increase the counter ``name`` with the given labels by ``value``."""
+    key = (name, tuple(sorted(labels.items())))
+    with _METRICS_LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+
+def gauge(name: str, value: float, **labels) -> None:
+    """Set the gauge ``name`` with the given labels to ``value``."""
+    key = (name, tuple(sorted(labels.items())))
+    with _METRICS_LOCK:
+        _GAUGES[key] = value
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the wrapped block or function as ``stage``.
+
+    Failures are counted in ``print_stage_failures_total``.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        count('print_stage_failures_total', stage=stage)
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def drain_metrics() -> dict:
+    """Return and reset the metrics recorded by this process.
+
+    Worker processes hand their metrics to the main process this way, see
+    ``merge_metrics``.
+    """
+    with _METRICS_LOCK:
+        snapshot = {
+            'histograms': dict(_HISTOGRAMS),
+            'sums': dict(_HISTOGRAM_SUMS),
+            'counters': dict(_COUNTERS),
+        }
+        _HISTOGRAMS.clear()
+        _HISTOGRAM_SUMS.clear()
+        _COUNTERS.clear()
+    return snapshot
+
+
+def merge_metrics(snapshot: dict) -> None:
+    """Add metrics returned by ``drain_metrics`` to this process."""
+    with _METRICS_LOCK:
+        for stage, buckets in snapshot['histograms'].items():
+            current = _HISTOGRAMS.setdefault(stage, [0] * len(buckets))
+            for index, value in enumerate(buckets):
+                current[index] += value
+        for stage, value in snapshot['sums'].items():
+            _HISTOGRAM_SUMS[stage] = _HISTOGRAM_SUMS.get(stage, 0.0) + value
+        for key, value in snapshot['counters'].items():
+            _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def render_metrics() -> str:
+    """Return all metrics in the Prometheus text exposition format."""
+    lines = [
+        '# TYPE print_stage_duration_seconds histogram',
+    ]
+    with _METRICS_LOCK:
+        histograms = {stage: list(buckets) for stage, buckets in _HISTOGRAMS.items()}
+        sums = dict(_HISTOGRAM_SUMS)
+        counters = dict(_COUNTERS)
+        gauges = dict(_GAUGES)
+
+    for stage, buckets in sorted(histograms.items()):
+        cumulative = 0
+        for bound, value in zip((*METRICS_BUCKETS, '+Inf'), buckets):
+            cumulative += value
+            lines.append(f'print_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'print_stage_duration_seconds_sum{{stage="{stage}"}} {sums[stage]}')
+        lines.append(f'print_stage_duration_seconds_count{{stage="{stage}"}} {cumulative}')
+
+    counters[('product_cache_hits_total', ())] = PRODUCT_CACHE_STATS['hits']
+    counters[('product_cache_misses_total', ())] = PRODUCT_CACHE_STATS['misses']
+    counters.setdefault(('cut_file_cache_hits_total', ()), 0)
+    counters.setdefault(('cut_file_cache_misses_total', ()), 0)
+
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            lines.append(f'# TYPE {name} counter')
+            typed.add(name)
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), value in sorted(gauges.items()):
+        if name not in typed:
+            lines.append(f'# TYPE {name} gauge')
+            typed.add(name)
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def log(message: str, **fields) -> None:
+    """Print ``message``, as a JSON line with ``fields`` if ``JSON_LOGS`` is set."""
+    if JSON_LOGS:
+        print(json.dumps({'time': datetime.now().isoformat(), 'message': message, **fields}), flush=True)
+    else:
+        print(message)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serve ``render_metrics`` on ``/metrics``."""
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host: str, port: int) -> ThreadingHTTPServer:
+    """Serve the metrics endpoint on a background thread."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+# German country names by ISO 3166-1 alpha-2 code, generated from the German
+# translation of pycountry:
+#   de = gettext.translation('iso3166-1', pycountry.LOCALES_DIR, languages=['de'])
+#   {c.alpha_2: de.gettext(getattr(c, 'common_name', None) or c.name) for c in pycountry.countries}
+COUNTRY_NAMES_FILE = 'countries_de.json'
+
+# Lines below the street, by country. Countries not listed use ADDRESS_FORMAT.
+ADDRESS_FORMAT = ('{postcode} {city}',)
+ADDRESS_FORMATS = {
+    'GB': ('{city}', '{postcode}'),
+    'IE': ('{city}', '{postcode}'),
+    'US': ('{city} {state} {postcode}',),
+    'CA': ('{city} {state} {postcode}',),
+    'AU': ('{city} {state} {postcode}',),
+    'LV': ('{city}, {postcode}',),
+}
+
+
+@lru_cache(maxsize=None)
+def _country_names() -> dict[str, str]:
+    """Load the country table on first use."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), COUNTRY_NAMES_FILE)
+    with open(path, encoding='utf-8') as table:
+        return json.load(table)
+
+
+@lru_cache(maxsize=None)
 def get_country_name(code):
-    country = pycountry.countries.get(alpha_2=code)
+    """Return the German name of the country ``code``, '' if it is unknown.
+
+    Codes missing from the table are looked up with pycountry, in English,
+    when it is installed.
+    """
+    name = _country_names().get(code)
+    if name is not None:
+        return name
+    try:
+        import pycountry
+    except ImportError:
+        return ''
+    country = pycountry.countries.get(alpha_2=code) if code else None
     return country.name if country else ''
 
 
-def get_order_status(order: dict):
-    order = get_order(order)
-    if order:
-        return order['status']
-    return False
+@lru_cache(maxsize=None)
+def _address_formatter(code: str):
+    """Return a function that formats the address lines of a ``code`` shipping address."""
+    line_formats = ADDRESS_FORMATS.get(code, ADDRESS_FORMAT)
+    country = get_country_name(code)
+
+    def format_address(shipping: dict) -> list[str]:
+        fields = {key: shipping.get(key) or '' for key in ('postcode', 'city', 'state')}
+        lines = [
+            f"{shipping['first_name']} {shipping['last_name']}",
+            shipping['address_1'],
+        ]
+        lines += [' '.join(line_format.format(**fields).split()) for line_format in line_formats]
+        lines.append(country)
+        return lines
+
+    return format_address
+
+
+def format_address(shipping: dict) -> list[str]:
+    """Return the receiver lines of ``shipping`` in the layout of its country."""
+    return _address_formatter(shipping.get('country', ''))(shipping)
+
+
+LABEL_DPI = 150  # resolution of the rasterised label pages
+LABEL_MARGIN_PT = 178  # width of the label column in PDF points
+LABEL_TEXT_X_PX = 70  # left edge of the address block at LABEL_DPI
+LABEL_LINE_HEIGHT_PX = 30  # distance between two address lines at LABEL_DPI
+
+
+def _resolve_font_path(path: str | None, fallback: str) -> str:
+    """Resolve ``path`` relative to this file, falling back to a bundled font.
+
+    ``fallback`` should be the path to the bundled font relative to this
+    file. It is returned whenever ``path`` is empty or does not exist.
+    """
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    if path:
+        if not os.path.isabs(path):
+            candidate = os.path.join(base_dir, path)
+            if os.path.exists(candidate):
+                return candidate
+        if os.path.exists(path):
+            return path
+    return os.path.join(base_dir, fallback)
+
+
+class LabelTemplate:
+    """The part of a label that is the same for every order.
+
+    Loads the fonts, parses the positions and lays out the static text (the
+    sender block and the "Empfänger:" heading) once, so that labelling an
+    order only has to add the receiver lines. Use ``get_label_template``
+    to get the shared template of a set of label settings.
+    """
+
+    def __init__(self, label_settings: dict):
+        self.font_size = int(label_settings['text_font_size']) * 3
+        sender_y = int(label_settings['text_sender_pos'].split(',')[1])
+        self.receiver_y = int(label_settings['text_receiver_pos'].split(',')[1])
+        self.font_paths = {
+            False: _resolve_font_path(label_settings.get('text_font_path'), os.path.join('fonts', 'roboto.ttf')),
+            True: _resolve_font_path(label_settings.get('text_bold_font_path'), os.path.join('fonts', 'Roboto-Bold.ttf')),
+        }
+        self.static_lines = [
+            (sender_y, 0, "Absender:", True),
+            (sender_y, 1, label_settings['sender_name'], False),
+            (sender_y, 2, label_settings['sender_street'], False),
+            (sender_y, 3, f"{label_settings['sender_postalcode']} {label_settings['sender_city']}", False),
+            (sender_y, 4, label_settings['sender_country'], False),
+            (self.receiver_y, 0, "Empfänger:", True),
+        ]
+        self._fonts = None
+        self._image_fonts = None
+        self._tile = None
+        # Laid out static text per page size
+        self._writers: dict[tuple[float, float], fitz.TextWriter] = {}
+
+    def receiver_lines(self, order: dict) -> list[tuple[int, int, str, bool]]:
+        return [
+            (self.receiver_y, line, text, False)
+            for line, text in enumerate(format_address(order['shipping']), start=1)
+        ]
+
+    def text_writer(self, rect: fitz.Rect, lines) -> fitz.TextWriter:
+        """Lay out ``lines`` as vector text for a page of size ``rect``."""
+        if self._fonts is None:
+            self._fonts = {bold: fitz.Font(fontfile=path) for bold, path in self.font_paths.items()}
+        scale = LABEL_DPI / 72
+        font_size = self.font_size / scale
+        writer = fitz.TextWriter(rect)
+        for block_y, line, text, bold in lines:
+            font = self._fonts[bold]
+            # PIL positions text by its ascender, PDF text by its baseline
+            y = (block_y + line * LABEL_LINE_HEIGHT_PX) / scale + font.ascender * font_size
+            writer.append((LABEL_TEXT_X_PX / scale, y), text, font=font, fontsize=font_size)
+        return writer
+
+    def static_writer(self, rect: fitz.Rect) -> fitz.TextWriter:
+        key = (rect.width, rect.height)
+        writer = self._writers.get(key)
+        if writer is None:
+            writer = self._writers[key] = self.text_writer(rect, self.static_lines)
+        return writer
+
+    def image_fonts(self) -> dict[bool, ImageFont.FreeTypeFont]:
+        if self._image_fonts is None:
+            fallbacks = {False: os.path.join('fonts', 'roboto.ttf'), True: os.path.join('fonts', 'Roboto-Bold.ttf')}
+            self._image_fonts = {}
+            for bold, path in self.font_paths.items():
+                try:
+                    self._image_fonts[bold] = ImageFont.truetype(path, self.font_size)
+                except OSError:
+                    fallback_path = os.path.join(os.path.dirname(__file__), fallbacks[bold])
+                    self._image_fonts[bold] = ImageFont.truetype(fallback_path, self.font_size)
+        return self._image_fonts
+
+    def draw_lines(self, image: Image.Image, lines) -> None:
+        draw = ImageDraw.Draw(image)
+        fonts = self.image_fonts()
+        for block_y, line, text, bold in lines:
+            draw.text(
+                (LABEL_TEXT_X_PX, block_y + line * LABEL_LINE_HEIGHT_PX),
+                text,
+                font=fonts[bold],
+                fill=(0, 0, 0),
+            )
+
+    def static_tile(self) -> Image.Image:
+        """Return the static text rendered into the top of the label column."""
+        if self._tile is None:
+            bottom = max(block_y + (line + 1) * LABEL_LINE_HEIGHT_PX for block_y, line, _, _ in self.static_lines)
+            width = int(LABEL_MARGIN_PT * LABEL_DPI / 72)
+            self._tile = Image.new("RGB", (width, bottom + self.font_size), (255, 255, 255))
+            self.draw_lines(self._tile, self.static_lines)
+        return self._tile
+
+
+@lru_cache(maxsize=4)
+def _compile_label_template(settings: tuple) -> LabelTemplate:
+    return LabelTemplate(dict(settings))
+
+
+def get_label_template(label_settings: dict) -> LabelTemplate:
+    """Return the shared ``LabelTemplate`` of ``label_settings``."""
+    return _compile_label_template(tuple(sorted(label_settings.items())))
 
 
 def add_label_to_pdf(input_file: str, output_file: str, order: dict, label_settings: dict):
+    """Widen every page of ``input_file`` and print the address label on it.
+
+    File based wrapper around ``label_document``.
+    """
+
     doc = fitz.open(input_file)
+    out_doc = label_document(doc, order, label_settings)
+    out_doc.save(output_file, **pdf_save_options())
+    out_doc.close()
+    doc.close()
+
+
+@timed('add_label_to_pdf')
+def label_document(doc: fitz.Document, order: dict, label_settings: dict) -> fitz.Document:
+    """Return a new document with every page of ``doc`` widened and labelled.
+
+    ``label_settings['label_mode']`` selects how the label is produced:
+    ``"vector"`` (default) keeps the original page as vector content and
+    writes the address as real text, ``"raster"`` renders every page to an
+    image first. ``doc`` itself is left unchanged.
+    """
+
+    template = get_label_template(label_settings)
+    if label_settings.get('label_mode', 'vector') == 'raster':
+        return _raster_label_document(doc, order, template)
+    return _vector_label_document(doc, order, template)
+
+
+def _vector_label_document(doc: fitz.Document, order: dict, template: LabelTemplate) -> fitz.Document:
     out_doc = fitz.open()
+    receiver_lines = template.receiver_lines(order)
+    receiver_writers = {}
 
-    def load_font(path: str | None, fallback: str) -> ImageFont.FreeTypeFont:
-        """Resolve and load the given font.
+    for page in doc:
+        width, height = page.rect.width, page.rect.height
+        new_page = out_doc.new_page(width=width + LABEL_MARGIN_PT, height=height)
+        new_page.show_pdf_page(
+            fitz.Rect(LABEL_MARGIN_PT, 0, LABEL_MARGIN_PT + width, height), doc, page.number
+        )
+        key = (new_page.rect.width, new_page.rect.height)
+        if key not in receiver_writers:
+            receiver_writers[key] = template.text_writer(new_page.rect, receiver_lines)
+        template.static_writer(new_page.rect).write_text(new_page)
+        receiver_writers[key].write_text(new_page)
 
-        If ``path`` is not provided or the file cannot be loaded, a fallback
-        font bundled with the repository is used. ``fallback`` should be the
-        path to that bundled font relative to this file.
-        """
+    return out_doc
 
-        if not path:
-            path = fallback
-        if not os.path.isabs(path):
-            candidate = os.path.join(os.path.dirname(__file__), path)
-            if os.path.exists(candidate):
-                path = candidate
-        try:
-            return ImageFont.truetype(path, font_size)
-        except OSError:
-            fallback_path = os.path.join(os.path.dirname(__file__), fallback)
-            return ImageFont.truetype(fallback_path, font_size)
 
-    font_size = int(label_settings['text_font_size']) * 3
+def _raster_label_document(doc: fitz.Document, order: dict, template: LabelTemplate) -> fitz.Document:
+    out_doc = fitz.open()
 
-    font_normal = load_font(label_settings.get('text_font_path'), os.path.join('fonts', 'roboto.ttf'))
-    font_bold = load_font(label_settings.get('text_bold_font_path'), os.path.join('fonts', 'Roboto-Bold.ttf'))
+    receiver_lines = template.receiver_lines(order)
+    static_tile = template.static_tile()
 
-    country = get_country_name(order['shipping']['country'])
-    
-    sender_position = tuple(map(int, label_settings['text_sender_pos'].split(',')))
-    receiver_position = tuple(map(int, label_settings['text_receiver_pos'].split(',')))
-    
-    text_color = (0, 0, 0)
-    dpi = 150
+    dpi = LABEL_DPI
     
     scale = dpi / 72  # convert between PDF points (72 DPI) and target resolution
-    extra_width_pt = 178  # desired label margin in PDF points
+    extra_width_pt = LABEL_MARGIN_PT  # desired label margin in PDF points
     extra_width_px = int(extra_width_pt * scale)
 
     for page in doc:
@@ -82,39 +477,38 @@ def add_label_to_pdf(input_file: str, output_file: str, order: dict, label_setti
         page_image = Image.frombytes("RGB", [old_width_px, old_height_px], pix.samples)
 
         image.paste(page_image, (extra_width_px, 0))
-
-        draw = ImageDraw.Draw(image)
-
-        draw.text((70, sender_position[1]), "Absender:", font=font_bold, fill=text_color)
-        draw.text((70, sender_position[1] + 30), label_settings['sender_name'], font=font_normal, fill=text_color)
-        draw.text((70, sender_position[1] + 60), label_settings['sender_street'], font=font_normal, fill=text_color)
-        draw.text((70, sender_position[1] + 90), f"{label_settings['sender_postalcode']} {label_settings['sender_city']}", font=font_normal, fill=text_color)
-        draw.text((70, sender_position[1] + 120), label_settings['sender_country'], font=font_normal, fill=text_color)
-
-        draw.text((70, receiver_position[1]), "Empfänger:", font=font_bold, fill=text_color)
-        draw.text((70, receiver_position[1] + 30), f"{order['shipping']['first_name']} {order['shipping']['last_name']}", font=font_normal, fill=text_color)
-        draw.text((70, receiver_position[1] + 60), order['shipping']['address_1'], font=font_normal, fill=text_color)
-        draw.text((70, receiver_position[1] + 90), f"{order['shipping']['postcode']} {order['shipping']['city']}", font=font_normal, fill=text_color)
-        draw.text((70, receiver_position[1] + 120), country, font=font_normal, fill=text_color)
+        image.paste(static_tile, (0, 0))
+        template.draw_lines(image, receiver_lines)
 
         img_buffer = io.BytesIO()
         image.save(img_buffer, format="PNG", optimize=True)
         img_buffer.seek(0)
+        jpeg = jpeg_image(image, img_buffer.getbuffer().nbytes)
+        if jpeg is not None:
+            img_buffer = io.BytesIO(jpeg)
 
         new_page = out_doc.new_page(width=new_width_pt, height=old_height_pt)
         new_page.insert_image(
             fitz.Rect(0, 0, new_width_pt, old_height_pt), stream=img_buffer.getvalue()
         )
 
-    out_doc.save(output_file)
-    out_doc.close()
-    doc.close()
+    return out_doc
 
 
 def merge_cut_file(base_pdf_path: str, overlay_pdf_path: str, output_pdf_path: str):
+    """File based wrapper around ``merge_cut_document``."""
     base_pdf = fitz.open(base_pdf_path)
-    overlay_pdf = fitz.open(overlay_pdf_path)
+    merge_cut_document(base_pdf, open_cut_file(overlay_pdf_path))
+    base_pdf.save(output_pdf_path, **pdf_save_options())
+    base_pdf.close()
+
+
+@timed('merge_cut_file')
+def merge_cut_document(base_pdf: fitz.Document, overlay_pdf: fitz.Document) -> fitz.Document:
+    """Place the pages of ``overlay_pdf`` centered on those of ``base_pdf``.
 
+    ``base_pdf`` is modified in place and returned.
+    """
     min_pages = min(len(base_pdf), len(overlay_pdf))
 
     for i in range(min_pages):
@@ -133,9 +527,8 @@ def merge_cut_file(base_pdf_path: str, overlay_pdf_path: str, output_pdf_path: s
         )
         base_page.show_pdf_page(rect, overlay_pdf, i)
 
-    base_pdf.save(output_pdf_path)
-    base_pdf.close()
-    overlay_pdf.close()
+    return base_pdf
+
 
 def find_key_in_nested_dict(data, key):
     if isinstance(data, dict):
@@ -152,15 +545,84 @@ def find_key_in_nested_dict(data, key):
                 return result
     return None
 
+def _cache_product(product: dict, fetched_at: float | None = None, persist: bool = True):
+    """Put ``product`` into the memory cache and, with ``persist``, the database."""
+    if fetched_at is None:
+        fetched_at = time.time()
+    PRODUCT_CACHE[product['id']] = (fetched_at, product)
+    PRODUCT_CACHE.move_to_end(product['id'])
+    while len(PRODUCT_CACHE) > PRODUCT_CACHE_SIZE:
+        PRODUCT_CACHE.popitem(last=False)
+    if persist:
+        conn = get_db()
+        with _DB_LOCK, conn:
+            conn.execute(
+                """
+                INSERT INTO products (id, data, fetched_at) VALUES (?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET data = excluded.data, fetched_at = excluded.fetched_at
+                """,
+                (product['id'], json.dumps(product), fetched_at),
+            )
+
+
+def _cached_product(product_id: int) -> dict | None:
+    """Return the product from memory or the database unless it expired."""
+    expires_before = time.time() - PRODUCT_CACHE_TTL
+    entry = PRODUCT_CACHE.get(product_id)
+    if entry is None:
+        with _DB_LOCK:
+            row = get_db().execute(
+                "SELECT data, fetched_at FROM products WHERE id = ?", (product_id,)
+            ).fetchone()
+        if row and row[1] >= expires_before:
+            product = json.loads(row[0])
+            _cache_product(product, row[1], persist=False)
+            return product
+        return None
+    if entry[0] < expires_before:
+        del PRODUCT_CACHE[product_id]
+        return None
+    PRODUCT_CACHE.move_to_end(product_id)
+    return entry[1]
+
+
+@timed('get_product')
 def _get_product(product_id: int) -> dict:
-    """Retrieve product data using a simple cache."""
-    product = PRODUCT_CACHE.get(product_id)
+    """Retrieve product data, from the cache where possible."""
+    product = _cached_product(product_id)
     if product is None:
-        product = WOOCOMMERCE_API.get(f"products/{product_id}").json()
-        PRODUCT_CACHE[product_id] = product
+        PRODUCT_CACHE_STATS['misses'] += 1
+        product = run_io(api_get(WOOCOMMERCE_API, f"products/{product_id}")).json()
+        _cache_product(product)
+    else:
+        PRODUCT_CACHE_STATS['hits'] += 1
     return product
 
 
+def prefetch_products(product_ids) -> None:
+    """Fetch all uncached products of ``product_ids`` with as few requests as possible.
+
+    Uses the ``include`` filter of the products endpoint, 100 products per
+    request, and sends the requests concurrently.
+    """
+    missing = sorted({product_id for product_id in product_ids if _cached_product(product_id) is None})
+    chunks = [missing[start:start + 100] for start in range(0, len(missing), 100)]
+    responses = gather_io(
+        api_get(
+            WOOCOMMERCE_API,
+            'products',
+            {'include': ','.join(map(str, chunk)), 'per_page': len(chunk)},
+        )
+        for chunk in chunks
+    )
+    for response in responses:
+        products = response.json()
+        if not isinstance(products, list):
+            raise ValueError(f"Unexpected response from WooCommerce API: {products}")
+        for product in products:
+            _cache_product(product)
+
+
 def get_print_id(order_item: dict):
     product = _get_product(order_item['product_id'])
     for meta in product.get('meta_data', []):
@@ -169,12 +631,50 @@ def get_print_id(order_item: dict):
     return None
 
 
+CUTS_DIR = 'cuts'
+CUT_FILE_CACHE_SIZE = 8  # parsed cut files kept open per process
+
+# Cut files by print ID, rebuilt whenever the cuts directory changes
+_CUT_FILES: dict[str, str] = {}
+_CUT_FILES_MTIME: int | None = None
+
+
+def _cut_file_index() -> dict[str, str]:
+    """Return the cut files by print ID, rescanning ``CUTS_DIR`` when it changed."""
+    global _CUT_FILES, _CUT_FILES_MTIME
+    mtime = os.stat(CUTS_DIR).st_mtime_ns
+    if mtime != _CUT_FILES_MTIME:
+        _CUT_FILES = {file: f'{CUTS_DIR}/{file}' for file in os.listdir(CUTS_DIR)}
+        _CUT_FILES_MTIME = mtime
+    return _CUT_FILES
+
+
 def get_cut_file(order_item: dict):
     print_id = get_print_id(order_item)
-    for file in os.listdir('cuts'):
-        if print_id == file:
-            return f'cuts/{file}'
-    return None
+    return _cut_file_index().get(print_id)
+
+
+@lru_cache(maxsize=CUT_FILE_CACHE_SIZE)
+def _load_cut_file(path: str, mtime_ns: int, size: int) -> fitz.Document:
+    # mtime_ns and size are part of the cache key only, so a replaced file
+    # is parsed again
+    return fitz.open(path)
+
+
+def open_cut_file(path: str) -> fitz.Document:
+    """Return the parsed cut file at ``path``, shared between calls.
+
+    The document must not be modified or closed by the caller.
+    """
+    stat = os.stat(path)
+    misses = _load_cut_file.cache_info().misses
+    doc = _load_cut_file(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    # Counted as metrics so the hits of render workers reach the main process
+    if _load_cut_file.cache_info().misses > misses:
+        count('cut_file_cache_misses_total')
+    else:
+        count('cut_file_cache_hits_total')
+    return doc
 
 
 def get_print_dpi(order_item: dict, default: int = 150) -> int:
@@ -188,24 +688,416 @@ def get_print_dpi(order_item: dict, default: int = 150) -> int:
     return default
 
 
-def download_image(url: str, output_file: str, retries: int = 5, delay: float = 2.0):
-    last_status = None
-    for _ in range(retries):
-        response = requests.get(url, stream=True)
-        if response.status_code == 200:
-            with open(output_file, "wb") as image_file:
-                for chunk in response.iter_content(1024):
-                    image_file.write(chunk)
-            return
-        last_status = response.status_code
-        time.sleep(delay)
-    raise Exception(f"Failed to download image: {url}, status code {last_status}")
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+DOWNLOAD_TIMEOUT = (5, 60)  # connect and read timeout in seconds
+DOWNLOAD_MAX_DELAY = 60  # upper bound of the retry backoff in seconds
+# Attempts of a download, failed print jobs are retried with the job backoff
+DOWNLOAD_RETRIES = 2
+TRANSIENT_STATUS_CODES = (408, 429)  # retried like server errors
+FLATE_COMPRESS_LEVEL = 1  # zlib level for images that have to be re-encoded
+# Encoding of artwork and raster label images: flate (lossless), jpeg, or
+# auto, which uses JPEG where it is below PDF_AUTO_JPEG_RATIO of the Flate size
+PDF_IMAGE_ENCODING = 'flate'
+PDF_JPEG_QUALITY = 90
+PDF_AUTO_JPEG_RATIO = 0.5
+# Drop unused and merge duplicate objects, compress streams and pack the
+# objects into object streams when final PDFs are saved
+PDF_OPTIMIZE = True
+HTTP_MAX_CONNECTIONS = 32  # connections of the shared HTTP client
+HTTP_MAX_PER_HOST = 8  # requests in flight per host
+API_RETRY_DELAY = 5  # seconds between two attempts of a WooCommerce request
+
+# All network I/O runs on one event loop in a background thread. The rest
+# of the program hands coroutines to it with submit_io and run_io.
+_IO_LOOP: asyncio.AbstractEventLoop | None = None
+_IO_LOCK = threading.Lock()
+# Only used from the I/O loop
+_HTTP_CLIENT: httpx.AsyncClient | None = None
+_HOST_LIMITS: dict[str, asyncio.Semaphore] = {}
+
+
+class DownloadError(Exception):
+    pass
+
+
+def get_io_loop() -> asyncio.AbstractEventLoop:
+    """Return the event loop of the network I/O, starting it on first use."""
+    global _IO_LOOP
+    with _IO_LOCK:
+        if _IO_LOOP is None:
+            _IO_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_IO_LOOP.run_forever, name='io', daemon=True).start()
+        return _IO_LOOP
+
+
+def _reset_io_after_fork() -> None:
+    # A forked worker has the loop object but not the thread running it
+    global _IO_LOOP, _IO_LOCK, _HTTP_CLIENT, _HOST_LIMITS
+    _IO_LOOP, _IO_LOCK, _HTTP_CLIENT, _HOST_LIMITS = None, threading.Lock(), None, {}
+
+
+os.register_at_fork(after_in_child=_reset_io_after_fork)
+
+
+def submit_io(coroutine) -> Future:
+    """Schedule ``coroutine`` on the I/O loop and return its future."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_io_loop())
+
+
+def run_io(coroutine):
+    """Run ``coroutine`` on the I/O loop and wait for its result."""
+    return submit_io(coroutine).result()
+
+
+async def _gather(*coroutines) -> list:
+    return await asyncio.gather(*coroutines)
+
+
+def gather_io(coroutines) -> list:
+    """Run ``coroutines`` concurrently on the I/O loop and return their results."""
+    return run_io(_gather(*coroutines))
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the HTTP client shared by all requests on the I/O loop."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(DOWNLOAD_TIMEOUT[1], connect=DOWNLOAD_TIMEOUT[0]),
+        )
+    return _HTTP_CLIENT
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    """Return the semaphore that caps the requests in flight to the host of ``url``."""
+    host = httpx.URL(url).host
+    semaphore = _HOST_LIMITS.get(host)
+    if semaphore is None:
+        semaphore = _HOST_LIMITS[host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    return semaphore
+
+
+class AsyncAPI(API):
+    """``woocommerce.API`` that can also send its requests on the I/O loop.
+
+    ``get`` works as before, ``get_async`` is its coroutine counterpart and
+    shares the connection pool and host limits with the image downloads.
+    """
+
+    async def get_async(self, endpoint: str, params: dict | None = None) -> httpx.Response:
+        params = dict(params or {})
+        # Build URL and authentication the same way API.get does
+        url = self._API__get_url(endpoint)
+        auth = None
+        if self.is_ssl and not self.query_string_auth:
+            auth = httpx.BasicAuth(self.consumer_key, self.consumer_secret)
+        elif self.is_ssl:
+            params.update(consumer_key=self.consumer_key, consumer_secret=self.consumer_secret)
+        else:
+            url = self._API__get_oauth_url(f"{url}?{urlencode(params)}", 'GET')
+            params = {}
+        headers = {'user-agent': self.user_agent, 'accept': 'application/json'}
+        async with _host_limit(url):
+            return await get_http_client().get(
+                url, params=params, auth=auth, headers=headers, timeout=self.timeout
+            )
+
+
+async def api_get(woocommerce_api: API, endpoint: str, params: dict | None = None):
+    """Send a GET request with ``woocommerce_api`` without blocking the I/O loop.
+
+    Clients without ``get_async``, such as a plain ``woocommerce.API``, are
+    run in a thread.
+    """
+    with timed('woocommerce_api'):
+        if isinstance(woocommerce_api, AsyncAPI):
+            return await woocommerce_api.get_async(endpoint, params)
+        if params:
+            return await asyncio.to_thread(woocommerce_api.get, endpoint, params=params)
+        return await asyncio.to_thread(woocommerce_api.get, endpoint)
+
+
+def _download_chunk_size(total: int | None) -> int:
+    """Pick a chunk size of 64 KiB to 4 MiB, about 1/64 of the download."""
+    if not total:
+        return 256 * 1024
+    return min(max(total // 64, 64 * 1024), 4 * 1024 * 1024)
+
+
+def _retry_delay(attempt: int, delay: float) -> float:
+    """Exponential backoff with full jitter, starting at ``delay`` seconds."""
+    return min(delay * 2 ** attempt, DOWNLOAD_MAX_DELAY) * random.uniform(0.5, 1.5)
+
+
+async def fetch_image_async(url: str, retries: int = DOWNLOAD_RETRIES, delay: float = 2.0) -> bytes:
+    """Download the PNG image at ``url`` and return its content.
+
+    Only transient errors are retried, other HTTP errors fail at once.
+    Interrupted transfers are resumed with an HTTP Range request on the
+    next attempt. The result is checked against the announced length and
+    the PNG signature before it is returned.
+    """
+    with timed('download_image'):
+        client = get_http_client()
+        data = bytearray()
+        last_error = None
+        for attempt in range(retries):
+            if attempt:
+                count('print_retries_total', stage='download_image')
+                await asyncio.sleep(_retry_delay(attempt - 1, delay))
+            headers = {'Range': f'bytes={len(data)}-'} if data else {}
+            try:
+                async with _host_limit(url), client.stream('GET', url, headers=headers) as response:
+                    if response.status_code == 200:
+                        data.clear()
+                        offset = 0
+                    elif response.status_code == 206 and data:
+                        offset = len(data)
+                    else:
+                        last_error = f"status code {response.status_code}"
+                        if response.status_code in TRANSIENT_STATUS_CODES or response.status_code >= 500:
+                            continue
+                        # A missing or forbidden image does not come back by asking again
+                        break
+                    content_length = response.headers.get('Content-Length')
+                    total = offset + int(content_length) if content_length else None
+                    async for chunk in response.aiter_raw(_download_chunk_size(total)):
+                        data.extend(chunk)
+            except httpx.TransportError as error:
+                # Keep what has arrived, the next attempt resumes from there
+                last_error = error
+                continue
+
+            if total is not None and len(data) != total:
+                last_error = f"received {len(data)} of {total} bytes"
+                continue
+            if not data.startswith(PNG_SIGNATURE):
+                last_error = "response is not a PNG image"
+                data.clear()
+                continue
+            return bytes(data)
+        raise DownloadError(f"Failed to download image: {url}, {last_error}")
+
+
+def fetch_image(url: str, retries: int = DOWNLOAD_RETRIES, delay: float = 2.0) -> bytes:
+    """Blocking wrapper around ``fetch_image_async``."""
+    return run_io(fetch_image_async(url, retries, delay))
+
+
+def download_image(url: str, output_file: str, retries: int = DOWNLOAD_RETRIES, delay: float = 2.0):
+    """File based wrapper around ``fetch_image``."""
+    data = fetch_image(url, retries, delay)
+    with open(output_file, "wb") as image_file:
+        image_file.write(data)
+
+
+def _png_header(png_data: bytes) -> tuple[int, int, int, int, int]:
+    """Return width, height, bit depth, color type and interlace method of a PNG."""
+    if not png_data.startswith(PNG_SIGNATURE) or png_data[12:16] != b'IHDR':
+        raise ValueError('not a PNG image')
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', png_data[16:29])
+    return width, height, bit_depth, color_type, interlace
+
+
+def _png_idat(png_data: bytes) -> bytes:
+    """Return the concatenated zlib stream of all IDAT chunks of a PNG."""
+    view = memoryview(png_data)
+    chunks = []
+    position = len(PNG_SIGNATURE)
+    while position + 8 <= len(png_data):
+        length, chunk_type = struct.unpack('>I4s', view[position:position + 8])
+        if chunk_type == b'IDAT':
+            chunks.append(view[position + 8:position + 8 + length])
+        elif chunk_type == b'IEND':
+            break
+        position += length + 12
+    return b''.join(chunks)
+
+
+def _flatten_png(png_data: bytes) -> bytearray:
+    """Decode any PNG and return its pixels as a zlib compressed RGB stream.
+
+    The image is converted in strips, so apart from the decoded image only
+    one strip at a time exists as RGB. Transparent pixels are composited
+    onto white.
+    """
+    image = Image.open(io.BytesIO(png_data))
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    if has_alpha and image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    compressor = zlib.compressobj(FLATE_COMPRESS_LEVEL)
+    stream = bytearray()
+    width, height = image.size
+    for top in range(0, height, 256):
+        strip = image.crop((0, top, width, min(top + 256, height)))
+        if has_alpha:
+            flattened = Image.new('RGB', strip.size, (255, 255, 255))
+            flattened.paste(strip, mask=strip)
+        else:
+            flattened = strip.convert('RGB')
+        stream += compressor.compress(flattened.tobytes())
+    stream += compressor.flush()
+    return stream
+
+
+def _rgb_image(png_data: bytes) -> Image.Image:
+    """Decode a PNG to RGB, compositing transparent pixels onto white."""
+    image = Image.open(io.BytesIO(png_data))
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        flattened = Image.new('RGB', image.size, (255, 255, 255))
+        flattened.paste(image, mask=image)
+        return flattened
+    return image.convert('RGB')
+
+
+def jpeg_image(image: Image.Image, lossless_size: int) -> bytes | None:
+    """Return ``image`` as JPEG if ``PDF_IMAGE_ENCODING`` picks JPEG for it, else None.
+
+    ``lossless_size`` is the size of the lossless encoding, which ``auto``
+    keeps unless JPEG is below ``PDF_AUTO_JPEG_RATIO`` of it.
+    """
+    if PDF_IMAGE_ENCODING not in ('jpeg', 'auto'):
+        return None
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=PDF_JPEG_QUALITY)
+    if PDF_IMAGE_ENCODING == 'auto' and buffer.tell() > lossless_size * PDF_AUTO_JPEG_RATIO:
+        count('pdf_images_total', encoding='flate')
+        return None
+    count('pdf_images_total', encoding='jpeg')
+    return buffer.getvalue()
+
+
+def pdf_save_options() -> dict:
+    """Return the ``fitz.Document.save`` options of final PDFs, see ``PDF_OPTIMIZE``."""
+    if not PDF_OPTIMIZE:
+        return {}
+    return {'garbage': 4, 'deflate': True, 'use_objstms': 1}
+
+
+@timed('png_to_pdf')
+def png_to_document(png_data: bytes, dpi: int = 150) -> fitz.Document:
+    """Return a one page PDF showing the PNG image ``png_data`` at ``dpi``.
+
+    8 bit RGB images are embedded without decoding them: the compressed
+    IDAT data becomes a FlateDecode image stream with the PNG predictor.
+    Every other PNG (alpha, palette, grey, 16 bit, interlaced) is decoded
+    once and flattened to RGB. With ``PDF_IMAGE_ENCODING`` set to ``jpeg``
+    or ``auto`` the image may be embedded as JPEG instead, see ``jpeg_image``.
+    """
+    width, height, bit_depth, color_type, interlace = _png_header(png_data)
+    if (bit_depth, color_type, interlace) == (8, 2, 0):
+        stream = _png_idat(png_data)
+        decode_parms = f"<< /Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns {width} >>"
+    elif PDF_IMAGE_ENCODING == 'jpeg':
+        # Only needed to compare against in auto mode
+        stream, decode_parms = b'', None
+    else:
+        stream = _flatten_png(png_data)
+        decode_parms = None
+    image_filter = "/FlateDecode"
+    if PDF_IMAGE_ENCODING != 'flate':
+        jpeg = jpeg_image(_rgb_image(png_data), len(stream))
+        if jpeg is not None:
+            stream, decode_parms, image_filter = jpeg, None, "/DCTDecode"
+
+    doc = fitz.open()
+    page = doc.new_page(width=width / dpi * 72, height=height / dpi * 72)
+    xref = doc.get_new_xref()
+    doc.update_object(
+        xref,
+        f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height}"
+        " /ColorSpace /DeviceRGB /BitsPerComponent 8 >>",
+    )
+    doc.update_stream(xref, stream, compress=False)
+    del stream
+    doc.xref_set_key(xref, "Filter", image_filter)
+    if decode_parms:
+        doc.xref_set_key(xref, "DecodeParms", decode_parms)
+    page.insert_image(page.rect, xref=xref)
+    return doc
 
 
 def png_to_pdf(png_path: str, pdf_path: str, dpi: int = 150):
-    image = Image.open(png_path)
-    rgb_image = image.convert('RGB')
-    rgb_image.save(pdf_path, resolution=dpi)
+    """File based wrapper around ``png_to_document``."""
+    with open(png_path, 'rb') as png_file:
+        doc = png_to_document(png_file.read(), dpi)
+    doc.save(pdf_path)
+    doc.close()
+
+
+def render_item(
+    png_data: bytes,
+    dpi: int,
+    order: dict,
+    label_settings: dict,
+    cut_file: str,
+) -> fitz.Document:
+    """Turn the artwork of an item into its final, labelled print document."""
+    doc = png_to_document(png_data, dpi)
+    return render_document(doc, order, label_settings, cut_file)
+
+
+def render_document(doc: fitz.Document, order: dict, label_settings: dict, cut_file: str) -> fitz.Document:
+    """Label ``doc`` and merge ``cut_file`` into it. ``doc`` is closed."""
+    labelled = label_document(doc, order, label_settings)
+    doc.close()
+    return merge_cut_document(labelled, open_cut_file(cut_file))
+
+
+@timed('hotfolder_write')
+def save_pdf_atomic(doc: fitz.Document, path: str, **options) -> None:
+    """Save ``doc`` to ``path`` without ever exposing a half-written file.
+
+    The document is written to a hidden temporary file next to ``path``
+    and renamed into place, so a hotfolder only ever sees complete PDFs.
+    """
+    directory, name = os.path.split(path)
+    temp_path = os.path.join(directory, f".{name}.part")
+    try:
+        doc.save(temp_path, **options)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def deliver_item(
+    doc: fitz.Document,
+    order: dict,
+    order_item: dict,
+    hotfolder_path: str,
+    copies: int = 1,
+    copy_mode: str = 'files',
+    copy_index: int = 0,
+) -> None:
+    """Write the final document of an item and its copies to the hotfolder.
+
+    With ``copies`` above one the remaining copies are either written as
+    ``final_{order}_{item}_{n}.pdf`` files (``copy_mode="files"``) or
+    appended as pages of the single final file (``copy_mode="multipage"``).
+    """
+    suffix = f"_{copy_index}" if copy_index else ""
+    final_output = (
+        f"{hotfolder_path}/final_{order['id']}_{order_item['id']}{suffix}.pdf"
+    )
+    if copies > 1 and copy_mode == 'multipage':
+        _append_copies_as_pages(doc, copies)
+        save_pdf_atomic(doc, final_output, **pdf_save_options())
+        return
+
+    save_pdf_atomic(doc, final_output, **pdf_save_options())
+    for copy in range(1, copies):
+        _link_or_copy(
+            final_output,
+            f"{hotfolder_path}/final_{order['id']}_{order_item['id']}_{copy}.pdf",
+        )
 
 
 def start_printing(
@@ -215,22 +1107,172 @@ def start_printing(
     label_settings: dict,
     hotfolder_path: str,
     copy_index: int = 0,
+    cut_file: str | None = None,
+    copies: int = 1,
+    copy_mode: str = 'files',
 ) -> None:
-    suffix = f"_{copy_index}" if copy_index else ""
-    file_output_path = f"temp/label_{order['id']}_{order_item['id']}{suffix}.pdf"
-    add_label_to_pdf(pdf_path, file_output_path, order, label_settings)
-    cut_file = get_cut_file(order_item)
+    """Label ``pdf_path``, merge the cut file and write it to the hotfolder.
+
+    File based wrapper around ``render_document`` and ``deliver_item``.
+    """
+    if cut_file is None:
+        cut_file = get_cut_file(order_item)
 
     if not cut_file:
         raise Exception('Cut file not found')
 
-    final_output = (
-        f"{hotfolder_path}/final_{order['id']}_{order_item['id']}{suffix}.pdf"
-    )
-    merge_cut_file(file_output_path, cut_file, final_output)
+    doc = render_document(fitz.open(pdf_path), order, label_settings, cut_file)
+    deliver_item(doc, order, order_item, hotfolder_path, copies, copy_mode, copy_index)
+    doc.close()
 
     os.remove(pdf_path)
-    os.remove(file_output_path)
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    """Hardlink ``source`` to ``target``, copying where links are unsupported."""
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        os.remove(target)
+        _link_or_copy(source, target)
+    except OSError:
+        _copy_atomic(source, target)
+
+
+def _copy_atomic(source: str, target: str) -> None:
+    """Copy ``source`` to ``target`` through a hidden temporary file."""
+    directory, name = os.path.split(target)
+    temp_path = os.path.join(directory, f".{name}.part")
+    shutil.copyfile(source, temp_path)
+    os.replace(temp_path, target)
+
+
+def _append_copies_as_pages(doc: fitz.Document, copies: int) -> None:
+    """Repeat the pages of ``doc`` until it holds ``copies`` copies of them.
+
+    The repeated pages share the images, fonts and cut contour of the
+    original page, so the file barely grows with the number of copies.
+    """
+    pages = len(doc)
+    for _ in range(1, copies):
+        for page_number in range(pages):
+            doc.fullcopy_page(page_number)
+
+
+# Rendered items by a hash of everything that goes into them, so reprints
+# and retries copy the finished PDF instead of rendering it again
+RENDER_CACHE_PATH = 'temp/render_cache'
+RENDER_CACHE_SIZE = 2 * 1024 ** 3  # bytes of rendered PDFs kept, 0 = disabled
+RENDER_CACHE_VERSION = 1  # raise when render_item produces different output for the same inputs
+
+
+@lru_cache(maxsize=32)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    # mtime_ns and size are part of the cache key only, see _load_cut_file
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """Return the SHA-256 of the file at ``path``, hashed again only when it changed."""
+    stat = os.stat(path)
+    return _file_digest(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def render_key(
+    png_data: bytes,
+    dpi: int,
+    order: dict,
+    label_settings: dict,
+    cut_file: str,
+    copies: int = 1,
+) -> str:
+    """Return the render cache key of the document ``render_item`` makes of these inputs.
+
+    Covers the artwork, the label (settings, fonts and receiver address),
+    the content of the cut file and the output settings, so changing any
+    of them changes the key.
+    """
+    template = get_label_template(label_settings)
+    inputs = [
+        RENDER_CACHE_VERSION,
+        fitz.VersionBind,
+        dpi,
+        sorted(label_settings.items()),
+        sorted(file_digest(path) for path in template.font_paths.values()),
+        format_address(order['shipping']),
+        file_digest(cut_file),
+        copies,
+        [PDF_IMAGE_ENCODING, PDF_JPEG_QUALITY, PDF_AUTO_JPEG_RATIO, PDF_OPTIMIZE],
+    ]
+    digest = hashlib.sha256(json.dumps(inputs, default=str).encode())
+    digest.update(png_data)
+    return digest.hexdigest()
+
+
+def _render_cache_file(key: str) -> str:
+    return os.path.join(RENDER_CACHE_PATH, f'{key}.pdf')
+
+
+def load_render(key: str | None, path: str) -> bool:
+    """Put the cached render ``key`` at ``path``, return whether there was one."""
+    if key is None or not RENDER_CACHE_SIZE:
+        return False
+    cache_file = _render_cache_file(key)
+    try:
+        _link_or_copy(cache_file, path)
+        # The modification time orders the cache for eviction
+        os.utime(cache_file)
+    except FileNotFoundError:
+        count('render_cache_total', result='miss')
+        return False
+    count('render_cache_total', result='hit')
+    return True
+
+
+def store_render(key: str | None, path: str) -> None:
+    """Keep the rendered document at ``path`` in the render cache as ``key``."""
+    if key is None or not RENDER_CACHE_SIZE:
+        return
+    os.makedirs(RENDER_CACHE_PATH, exist_ok=True)
+    cache_file = _render_cache_file(key)
+    if not os.path.exists(cache_file):
+        _link_or_copy(path, cache_file)
+    evict_renders()
+
+
+def evict_renders(max_size: int | None = None) -> None:
+    """Remove the least recently used renders until the cache fits ``max_size`` bytes."""
+    max_size = RENDER_CACHE_SIZE if max_size is None else max_size
+    try:
+        entries = [
+            entry for entry in os.scandir(RENDER_CACHE_PATH)
+            if entry.name.endswith('.pdf') and not entry.name.startswith('.')
+        ]
+    except FileNotFoundError:
+        return
+    files = []
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Evicted by another worker
+            pass
+        total -= size
+        count('render_cache_evictions_total')
 
 
 def save_base64_to_png(base64_data, output_file):
@@ -245,123 +1287,1664 @@ def save_base64_to_png(base64_data, output_file):
         print(f"Fehler beim Speichern von {output_file}: {e}")
 
 
+# One long-lived connection per database file, shared by all threads
+_DB_CONNECTIONS: dict[str, sqlite3.Connection] = {}
+_DB_LOCK = threading.RLock()
+# WAL needs shared memory, use DELETE for a database on a network file system
+DB_JOURNAL_MODE = 'WAL'
+DB_BUSY_TIMEOUT = 30  # seconds to wait for a write lock held by another worker
+
+# SQLite connections must not be used across a fork
+os.register_at_fork(after_in_child=_DB_CONNECTIONS.clear)
+
+
+def get_db(db_name: str | None = None) -> sqlite3.Connection:
+    """Return the shared connection to ``db_name`` (``DB_NAME`` by default).
+
+    The database runs in WAL mode so readers never block the writer.
+    Callers that use the connection from several threads must hold
+    ``_DB_LOCK``.
+    """
+    db_name = db_name or DB_NAME
+    with _DB_LOCK:
+        conn = _DB_CONNECTIONS.get(db_name)
+        if conn is None:
+            conn = sqlite3.connect(db_name, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+            conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            _DB_CONNECTIONS[db_name] = conn
+        return conn
+
+
 def create_db(db_name: str):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY,
-            status BOOLEAN NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    conn.close()
+    conn = get_db(db_name)
+    with _DB_LOCK, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER PRIMARY KEY,
+                status BOOLEAN NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Order tables created before the dashboard existed
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(orders)")}
+        for column in ('number', 'customer', 'items'):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE orders ADD COLUMN {column} TEXT")
+        # The dashboard pages through the newest orders, see list_orders
+        conn.execute("CREATE INDEX IF NOT EXISTS orders_created ON orders (created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS orders_status_created ON orders (status, created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        # Orders with unfinished jobs, kept so they can be resumed after a restart
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS queued_orders (
+                id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                queued_at REAL NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        if 'priority' not in {row[1] for row in conn.execute("PRAGMA table_info(queued_orders)")}:
+            conn.execute("ALTER TABLE queued_orders ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        # One job per copy of every line item. A worker that works on a job
+        # holds it until lease_until, see claim_jobs.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                order_id INTEGER NOT NULL,
+                item_id INTEGER NOT NULL,
+                copy INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                affinity TEXT,
+                worker TEXT,
+                lease_until REAL NOT NULL DEFAULT 0,
+                held_at REAL,
+                PRIMARY KEY (order_id, item_id, copy)
+            )
+        """)
+        # Job tables created before claims existed
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in (
+            ('affinity', 'TEXT'),
+            ('worker', 'TEXT'),
+            ('lease_until', 'REAL NOT NULL DEFAULT 0'),
+            ('held_at', 'REAL'),
+        ):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, next_attempt_at)")
+
+
+# Values of orders.status and how the dashboard calls them. Reprinted
+# orders are printing again, new orders only get a row once they are done.
+ORDER_STATUSES = {1: 'completed', -1: 'failed', 0: 'printing'}
+DASHBOARD_PAGE_SIZE = 50
+DASHBOARD_MAX_PAGE_SIZE = 500
+
+
+def _order_customer(order: dict) -> str | None:
+    """Return "Company, First Last" of the billing address of ``order``."""
+    billing = order.get('billing') or order.get('shipping')
+    if not billing:
+        return None
+    name = ' '.join(part for part in (billing.get('first_name'), billing.get('last_name')) if part)
+    return ', '.join(part for part in (billing.get('company'), name) if part) or None
+
+
+def _order_items(order: dict) -> str | None:
+    items = [
+        f"{item.get('quantity', 1)}x {item['name']}"
+        for item in order.get('line_items', []) if item.get('name')
+    ]
+    return ', '.join(items) or None
+
+
+def _dashboard_order(row) -> dict:
+    return {
+        'id': row[0],
+        'status': ORDER_STATUSES.get(row[1]),
+        'created_at': row[2],
+        'number': row[3] or str(row[0]),
+        'customer': row[4],
+        'items': row[5],
+    }
 
 
-def save_order(order: dict, status: bool):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO orders (id, status) VALUES (?, ?)", (order['id'], status))
-    conn.commit()
-    conn.close()
-    
-    
-def update_order(order: dict, status: bool):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE orders SET status = ? WHERE id = ?", (status, order['id']))
-    conn.commit()
-    conn.close()
+@timed('sqlite_upsert_order')
+def upsert_order(order: dict, status: bool):
+    """Insert ``order`` with ``status`` or update the status of a known order.
+
+    The change is published to the dashboard, see ``publish``.
+    """
+    conn = get_db()
+    with _DB_LOCK, conn:
+        row = conn.execute(
+            """
+            INSERT INTO orders (id, status, number, customer, items) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                status = excluded.status,
+                number = COALESCE(excluded.number, number),
+                customer = COALESCE(excluded.customer, customer),
+                items = COALESCE(excluded.items, items)
+            RETURNING id, status, created_at, number, customer, items
+            """,
+            (order['id'], status, order.get('number'), _order_customer(order), _order_items(order)),
+        ).fetchone()
+    publish('order', _dashboard_order(row))
 
 
 def get_orders():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, status, created_at FROM orders")
-    orders = cursor.fetchall()
-    conn.close()
-    
+    with _DB_LOCK:
+        orders = get_db().execute("SELECT id, status, created_at FROM orders").fetchall()
+
     return [{"id": order[0], "status": bool(order[1]), "created_at": order[2]} for order in orders]
 
 
+@timed('sqlite_list_orders')
+def list_orders(
+    status: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    after: str | None = None,
+    limit: int = DASHBOARD_PAGE_SIZE,
+) -> tuple[list[dict], str | None]:
+    """Return a page of stored orders, newest first, and the cursor of the next page.
+
+    ``status`` is one of the names in ``ORDER_STATUSES``, ``since`` and
+    ``until`` are inclusive dates (``YYYY-MM-DD``). Pages are addressed by
+    the last order of the previous page (``after``) instead of an offset,
+    so every page is a short range scan of an index however many orders
+    there are. The cursor is None on the last page.
+    """
+    if limit < 1:
+        # SQLite reads a negative LIMIT as no limit at all
+        raise ValueError(f'Invalid page size: {limit}')
+    conditions, params = [], []
+    if status is not None:
+        codes = [code for code, name in ORDER_STATUSES.items() if name == status]
+        if not codes:
+            raise ValueError(f'Unknown order status: {status}')
+        conditions.append("status = ?")
+        params.append(codes[0])
+    if since:
+        conditions.append("created_at >= date(?)")
+        params.append(since)
+    if until:
+        conditions.append("created_at < date(?, '+1 day')")
+        params.append(until)
+    if after:
+        created_at, _, order_id = after.rpartition('|')
+        conditions.append("(created_at, id) < (?, ?)")
+        params += [created_at, int(order_id)]
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with _DB_LOCK:
+        rows = get_db().execute(
+            f"""
+            SELECT id, status, created_at, number, customer, items FROM orders {where}
+            ORDER BY created_at DESC, id DESC LIMIT ?
+            """,
+            (*params, limit + 1),
+        ).fetchall()
+
+    orders = [_dashboard_order(row) for row in rows[:limit]]
+    cursor = None
+    if len(rows) > limit:
+        cursor = f"{orders[-1]['created_at']}|{orders[-1]['id']}"
+    return orders, cursor
+
+
+def list_printing_orders() -> list[dict]:
+    """Return the orders that still have jobs to print, newest first."""
+    with _DB_LOCK:
+        rows = get_db().execute(
+            "SELECT data, datetime(queued_at, 'unixepoch') FROM queued_orders ORDER BY queued_at DESC, id DESC"
+        ).fetchall()
+    orders = []
+    for data, queued_at in rows:
+        order = json.loads(data)
+        orders.append(_dashboard_order(
+            (order['id'], 0, queued_at, order.get('number'), _order_customer(order), _order_items(order))
+        ))
+    return orders
+
+
+def reprint_order(order: dict) -> None:
+    """Print every copy of every item of ``order`` again.
+
+    The order keeps its row, marked as printing until the new jobs are done.
+    Its jobs are picked up by ``run_due_jobs``. Renders still waiting in
+    the staging area are dropped, so the items are rendered again.
+    """
+    for item in order['line_items']:
+        staged_path = os.path.join(STAGING_PATH, f"final_{order['id']}_{item['id']}.pdf")
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+    conn = get_db()
+    with _DB_LOCK, conn:
+        conn.execute("DELETE FROM jobs WHERE order_id = ?", (order['id'],))
+        conn.execute("UPDATE orders SET status = 0 WHERE id = ?", (order['id'],))
+    enqueue_order(order)
+    log(f'Order({order["id"]}) queued for reprint', order_id=order['id'])
+
+
+@timed('sqlite_get_order')
 def get_order(order: dict):
-    orders_db = get_orders()
-    if orders_db:
-        for order_db in orders_db:
-            if order_db['id'] == order['id']:
-                return order_db
+    with _DB_LOCK:
+        order_db = get_db().execute(
+            "SELECT id, status, created_at FROM orders WHERE id = ?", (order['id'],)
+        ).fetchone()
+    if order_db:
+        return {"id": order_db[0], "status": bool(order_db[1]), "created_at": order_db[2]}
     return None
 
 
-def order_check(woocommerce_api: API, label_settings: dict, hotfolder_path: str, url: str) -> None:
-    attempts = 3
+@timed('sqlite_get_sync_state')
+def get_sync_state(key: str) -> str | None:
+    with _DB_LOCK:
+        row = get_db().execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+@timed('sqlite_set_sync_state')
+def set_sync_state(key: str, value: str):
+    conn = get_db()
+    with _DB_LOCK, conn:
+        conn.execute(
+            """
+            INSERT INTO sync_state (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+            """,
+            (key, value),
+        )
+
+
+@timed('sqlite_get_known_order_ids')
+def get_known_order_ids(order_ids: list[int]) -> set[int]:
+    """Return the subset of ``order_ids`` that is already stored."""
+    known = set()
+    order_ids = list(order_ids)
+    # Stay well below SQLite's limit of bound parameters per statement
+    for start in range(0, len(order_ids), 500):
+        chunk = order_ids[start:start + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        with _DB_LOCK:
+            rows = get_db().execute(
+                f"SELECT id FROM orders WHERE id IN ({placeholders})", chunk
+            ).fetchall()
+        known.update(row[0] for row in rows)
+    return known
+
+
+# Life cycle of a job: queued -> downloading -> rendered -> delivered, or
+# failed once JOB_MAX_ATTEMPTS attempts went wrong. Rendered jobs are held
+# while the hotfolder is full, see hotfolder_has_room.
+JOB_OPEN_STATES = ('queued', 'downloading', 'rendered', 'held')
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 5  # seconds before the first retry, doubled on every further one
+JOB_MAX_DELAY = 300  # upper bound of the retry backoff in seconds
+# Rendered items wait here until all their copies are in the hotfolder. On
+# the same file system as the hotfolder every copy is a hardlink.
+STAGING_PATH = 'temp/staging'
+# Files and bytes waiting for the RIP in the hotfolder before deliveries
+# are held back in the staging area, 0 = no limit
+HOTFOLDER_MAX_FILES = 100
+HOTFOLDER_MAX_BYTES = 4 * 1024 ** 3
+HOTFOLDER_POLL = 5  # seconds between two checks of a full hotfolder
+# Orders with one of these words in a shipping method are delivered first
+EXPRESS_SHIPPING = ('express',)
+# Several workers can share the database, each one claims the jobs it works on
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+# Print ids (cut files) this worker prints, empty = all
+WORKER_AFFINITY: set[str] = set()
+# Affinity of items whose print id could not be looked up yet. Only workers
+# without WORKER_AFFINITY claim them until resolve_affinities finds it.
+UNRESOLVED_AFFINITY = '?'
+CLAIM_LEASE = 60  # seconds a claim lasts without a heartbeat
+
+
+def _job_affinity(order_item: dict) -> str | None:
+    """Return the print id that decides which workers may print ``order_item``."""
+    if 'product_id' not in order_item:
+        return None
+    try:
+        return get_print_id(order_item)
+    except Exception as error:
+        log(f'No print id for item {order_item["id"]} yet: {error}')
+        return UNRESOLVED_AFFINITY
+
+
+def resolve_affinities() -> None:
+    """Look up the print ids of open jobs that were queued without one."""
+    placeholders = ", ".join("?" * len(JOB_OPEN_STATES))
+    with _DB_LOCK:
+        rows = get_db().execute(
+            f"""
+            SELECT DISTINCT jobs.item_id, queued_orders.id, queued_orders.data
+            FROM jobs JOIN queued_orders ON queued_orders.id = jobs.order_id
+            WHERE jobs.affinity = ? AND jobs.state IN ({placeholders})
+            """,
+            (UNRESOLVED_AFFINITY, *JOB_OPEN_STATES),
+        ).fetchall()
+    for item_id, order_id, data in rows:
+        item = next(item for item in json.loads(data)['line_items'] if item['id'] == item_id)
+        affinity = _job_affinity(item)
+        if affinity == UNRESOLVED_AFFINITY:
+            continue
+        conn = get_db()
+        with _DB_LOCK, conn:
+            conn.execute(
+                "UPDATE jobs SET affinity = ? WHERE order_id = ? AND item_id = ? AND affinity = ?",
+                (affinity, order_id, item_id, UNRESOLVED_AFFINITY),
+            )
+
+
+def _claimable(now: float) -> tuple[str, tuple]:
+    """Return the SQL condition and parameters of jobs this worker may claim."""
+    condition = "(worker IS NULL OR worker = ? OR lease_until < ?)"
+    params = (WORKER_ID, now)
+    if WORKER_AFFINITY:
+        placeholders = ", ".join("?" * len(WORKER_AFFINITY))
+        condition += f" AND (affinity IS NULL OR affinity IN ({placeholders}))"
+        params += tuple(sorted(WORKER_AFFINITY))
+    return condition, params
+
+
+def order_priority(order: dict) -> int:
+    """Return 1 for orders shipped with an ``EXPRESS_SHIPPING`` method, else 0."""
+    for line in order.get('shipping_lines') or []:
+        method = f"{line.get('method_id', '')} {line.get('method_title', '')}".lower()
+        if any(word.lower() in method for word in EXPRESS_SHIPPING):
+            return 1
+    return 0
+
+
+@timed('sqlite_enqueue_order')
+def enqueue_order(order: dict) -> None:
+    """Create a queued job for every copy of every item of ``order``.
+
+    Does nothing for copies that already have a job, so an order can be
+    enqueued again without losing its progress.
+    """
+    conn = get_db()
+    with _DB_LOCK, conn:
+        # Another worker may have finished the order in the meantime
+        cursor = conn.execute(
+            """
+            INSERT INTO queued_orders (id, data, queued_at, priority)
+            SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM orders WHERE id = ? AND status != 0)
+            ON CONFLICT (id) DO NOTHING
+            """,
+            (order['id'], json.dumps(order), time.time(), order_priority(order), order['id']),
+        )
+        has_jobs = conn.execute(
+            "SELECT 1 FROM jobs WHERE order_id = ? LIMIT 1", (order['id'],)
+        ).fetchone()
+    if cursor.rowcount:
+        publish('order', _dashboard_order((
+            order['id'], 0, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+            order.get('number'), _order_customer(order), _order_items(order),
+        )))
+    if has_jobs:
+        return
+    affinities = {item['id']: _job_affinity(item) for item in order['line_items']}
+    with _DB_LOCK, conn:
+        conn.executemany(
+            "INSERT INTO jobs (order_id, item_id, copy, affinity) VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING",
+            (
+                (order['id'], item['id'], copy, affinities[item['id']])
+                for item in order['line_items']
+                for copy in range(item.get('quantity', 1))
+            ),
+        )
+
+
+def get_jobs(order_id: int) -> list[dict]:
+    with _DB_LOCK:
+        rows = get_db().execute(
+            """
+            SELECT item_id, copy, state, attempts, next_attempt_at, error
+            FROM jobs WHERE order_id = ? ORDER BY item_id, copy
+            """,
+            (order_id,),
+        ).fetchall()
+    return [
+        {
+            'item_id': row[0],
+            'copy': row[1],
+            'state': row[2],
+            'attempts': row[3],
+            'next_attempt_at': row[4],
+            'error': row[5],
+        }
+        for row in rows
+    ]
+
+
+def set_job_state(order_id: int, item_id: int, copies: list[int], state: str) -> None:
+    conn = get_db()
+    with _DB_LOCK, conn:
+        conn.executemany(
+            """
+            UPDATE jobs SET state = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE order_id = ? AND item_id = ? AND copy = ?
+            """,
+            ((state, order_id, item_id, copy) for copy in copies),
+        )
+
+
+def fail_jobs(order_id: int, item_id: int, copies: list[int], error: str) -> None:
+    """Count a failed attempt and schedule the next one with exponential backoff.
+
+    Jobs that reached ``JOB_MAX_ATTEMPTS`` are marked failed for good.
+    """
+    conn = get_db()
+    with _DB_LOCK, conn:
+        conn.executemany(
+            """
+            UPDATE jobs SET
+                attempts = attempts + 1,
+                state = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'queued' END,
+                next_attempt_at = ? + MIN(?, ? * (1 << attempts)),
+                error = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE order_id = ? AND item_id = ? AND copy = ?
+            """,
+            (
+                (JOB_MAX_ATTEMPTS, time.time(), JOB_MAX_DELAY, JOB_RETRY_DELAY, error, order_id, item_id, copy)
+                for copy in copies
+            ),
+        )
+
+
+def hold_jobs(order_id: int, item_id: int, copies: list[int]) -> None:
+    """Keep rendered ``copies`` in the staging area until the hotfolder has room."""
+    now = time.time()
+    conn = get_db()
+    with _DB_LOCK, conn:
+        conn.executemany(
+            """
+            UPDATE jobs SET
+                state = 'held',
+                held_at = COALESCE(held_at, ?),
+                next_attempt_at = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE order_id = ? AND item_id = ? AND copy = ?
+            """,
+            ((now, now + HOTFOLDER_POLL, order_id, item_id, copy) for copy in copies),
+        )
+
+
+def deliver_jobs(order_id: int, item_id: int, copies: list[int]) -> None:
+    """Mark ``copies`` delivered and record how long held copies waited."""
+    now = time.time()
+    conn = get_db()
+    placeholders = ", ".join("?" * len(copies))
+    with _DB_LOCK, conn:
+        held = conn.execute(
+            f"""
+            SELECT held_at FROM jobs
+            WHERE order_id = ? AND item_id = ? AND copy IN ({placeholders}) AND held_at IS NOT NULL
+            """,
+            (order_id, item_id, *copies),
+        ).fetchall()
+        conn.execute(
+            f"""
+            UPDATE jobs SET state = 'delivered', held_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE order_id = ? AND item_id = ? AND copy IN ({placeholders})
+            """,
+            (order_id, item_id, *copies),
+        )
+    for (held_at,) in held:
+        observe('hotfolder_wait', now - held_at)
+
+
+def held_ahead(order_id: int) -> bool:
+    """Tell whether copies of an order that goes before ``order_id`` are held.
+
+    Only jobs this worker could claim count. Workers with their own
+    affinity usually feed their own printer and hotfolder.
+    """
+    condition, params = _claimable(time.time())
+    with _DB_LOCK:
+        row = get_db().execute(
+            f"""
+            SELECT 1 FROM queued_orders AS own, jobs
+            JOIN queued_orders AS other ON other.id = jobs.order_id
+            WHERE own.id = ? AND jobs.state = 'held' AND jobs.order_id != own.id
+                AND (other.priority > own.priority
+                     OR (other.priority = own.priority AND other.queued_at < own.queued_at))
+                AND {condition}
+            LIMIT 1
+            """,
+            (order_id, *params),
+        ).fetchone()
+    return row is not None
+
+
+@timed('sqlite_claim_jobs')
+def claim_jobs(order_id: int) -> dict[int, list[int]]:
+    """Claim the due jobs of ``order_id`` for this worker.
+
+    A job can be claimed when no other worker holds it or its lease has
+    expired, e.g. because the worker died. The claim is a single UPDATE, so
+    two workers never get the same job. Returns the claimed copies by item.
+    """
+    now = time.time()
+    placeholders = ", ".join("?" * len(JOB_OPEN_STATES))
+    condition, params = _claimable(now)
+    conn = get_db()
+    with _DB_LOCK, conn:
+        rows = conn.execute(
+            f"""
+            UPDATE jobs SET worker = ?, lease_until = ?
+            WHERE order_id = ? AND state IN ({placeholders}) AND next_attempt_at <= ? AND {condition}
+            RETURNING item_id, copy
+            """,
+            (WORKER_ID, now + CLAIM_LEASE, order_id, *JOB_OPEN_STATES, now, *params),
+        ).fetchall()
+    claimed = {}
+    for item_id, copy in sorted(rows):
+        claimed.setdefault(item_id, []).append(copy)
+    return claimed
+
+
+def release_jobs(order_id: int) -> None:
+    """Give up the claims of this worker on ``order_id``."""
+    conn = get_db()
+    with _DB_LOCK, conn:
+        conn.execute(
+            "UPDATE jobs SET worker = NULL, lease_until = 0 WHERE order_id = ? AND worker = ?",
+            (order_id, WORKER_ID),
+        )
+
+
+def holds_claim(order_id: int, item_id: int) -> bool:
+    """Renew the lease on an item and tell whether this worker still holds it."""
+    conn = get_db()
+    with _DB_LOCK, conn:
+        cursor = conn.execute(
+            """
+            UPDATE jobs SET lease_until = ?
+            WHERE order_id = ? AND item_id = ? AND worker = ?
+            """,
+            (time.time() + CLAIM_LEASE, order_id, item_id, WORKER_ID),
+        )
+    return cursor.rowcount > 0
+
+
+def renew_leases() -> None:
+    """Extend the lease of every job this worker holds."""
+    conn = get_db()
+    with _DB_LOCK, conn:
+        conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE worker = ?",
+            (time.time() + CLAIM_LEASE, WORKER_ID),
+        )
+
+
+def start_heartbeat(interval: float | None = None) -> threading.Thread:
+    """Renew the leases of this worker every ``interval`` seconds in the background."""
+    interval = interval or CLAIM_LEASE / 3
+
+    def heartbeat():
+        while True:
+            time.sleep(interval)
+            try:
+                renew_leases()
+            except Exception as error:
+                log(f'Failed to renew leases: {error}')
+
+    thread = threading.Thread(target=heartbeat, name='heartbeat', daemon=True)
+    thread.start()
+    return thread
+
+
+def get_due_orders(now: float | None = None) -> list[dict]:
+    """Return the queued orders that have jobs this worker can run now.
+
+    Express orders come first, then the orders in the order they arrived.
+    """
+    now = time.time() if now is None else now
+    placeholders = ", ".join("?" * len(JOB_OPEN_STATES))
+    condition, params = _claimable(now)
+    with _DB_LOCK:
+        rows = get_db().execute(
+            f"""
+            SELECT data FROM queued_orders WHERE id IN (
+                SELECT order_id FROM jobs
+                WHERE state IN ({placeholders}) AND next_attempt_at <= ? AND {condition}
+            )
+            ORDER BY priority DESC, queued_at, id
+            """,
+            (*JOB_OPEN_STATES, now, *params),
+        ).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def next_job_due() -> float | None:
+    """Return the time at which the next open job of this worker is ready to run.
+
+    Jobs held by another worker count from the end of their lease.
+    """
+    placeholders = ", ".join("?" * len(JOB_OPEN_STATES))
+    condition, params = _claimable(float('inf'))
+    with _DB_LOCK:
+        row = get_db().execute(
+            f"""
+            SELECT MIN(MAX(next_attempt_at, CASE WHEN worker = ? THEN 0 ELSE lease_until END))
+            FROM jobs WHERE state IN ({placeholders}) AND {condition}
+            """,
+            (WORKER_ID, *JOB_OPEN_STATES, *params),
+        ).fetchone()
+    return row[0]
+
+
+def resume_jobs() -> None:
+    """Queue jobs again that were interrupted while downloading or rendering.
+
+    Only touches jobs that are not held by another live worker.
+    """
+    conn = get_db()
+    with _DB_LOCK, conn:
+        conn.execute(
+            """
+            UPDATE jobs SET state = 'queued'
+            WHERE state = 'downloading' AND (worker IS NULL OR worker = ? OR lease_until < ?)
+            """,
+            (WORKER_ID, time.time()),
+        )
+
+
+def _finish_order(order: dict) -> None:
+    """Record ``order`` as printed or failed once none of its jobs is open."""
+    states = {job['state'] for job in get_jobs(order['id'])}
+    if states & set(JOB_OPEN_STATES):
+        return
+    status = 'failed' if 'failed' in states else 'completed'
+    conn = get_db()
+    with _DB_LOCK, conn:
+        row = conn.execute(
+            "DELETE FROM queued_orders WHERE id = ? RETURNING queued_at", (order['id'],)
+        ).fetchone()
+    if row is None:
+        # Another worker finished the order
+        return
+    upsert_order(order, True if status == 'completed' else -1)
+    count('print_orders_total', result=status)
+    if status == 'completed':
+        seconds = time.time() - row[0]
+        observe('order', seconds)
+        log(f'Order({order["id"]}) completed', order_id=order['id'], seconds=round(seconds, 3))
+    else:
+        log(f'Order({order["id"]}) failed to print', order_id=order['id'])
+
+
+def _print_jobs(order: dict, url: str) -> list[dict]:
+    """Claim the due jobs of ``order`` and return them grouped by line item.
+
+    Every copy of an item shares the same artwork, so an item is
+    downloaded and rendered once and its copies are fanned out afterwards.
+    ``copy_numbers`` lists the copies that still have to be delivered and
+    ``staged_path`` is where the rendered item waits for them.
+    """
+    due = claim_jobs(order['id'])
+
+    jobs = []
+    for item in order['line_items']:
+        if item['id'] not in due:
+            continue
+        jobs.append({
+            'item': item,
+            'copies': item.get('quantity', 1),
+            'copy_numbers': due[item['id']],
+            'png_url': f"{url}/Order/order-{order['id']}/item-{item['id']}.png",
+            'staged_path': os.path.join(STAGING_PATH, f"final_{order['id']}_{item['id']}.pdf"),
+        })
+    return jobs
+
+
+def _render_args(order: dict, job: dict, png_data: bytes, label_settings: dict, copy_mode: str) -> tuple:
+    """Return the ``print_item`` arguments that render ``job`` into the staging area."""
+    return (
+        order,
+        job['item'],
+        png_data,
+        get_print_dpi(job['item']),
+        get_cut_file(job['item']),
+        label_settings,
+        STAGING_PATH,
+        # Separate copies are hardlinked on delivery, pages have to be rendered
+        job['copies'] if copy_mode == 'multipage' else 1,
+        copy_mode,
+    )
+
+
+def _render_job_key(args: tuple) -> str | None:
+    """Return the render cache key of ``print_item(*args)``, None when it cannot render."""
+    order, _, png_data, dpi, cut_file, label_settings, _, copies, _ = args
+    if not cut_file or not RENDER_CACHE_SIZE:
+        return None
+    return render_key(png_data, dpi, order, label_settings, cut_file, copies)
+
+
+def _job_failed(order: dict, job: dict, copies: list[int], error: Exception) -> None:
+    """Log the current exception and schedule the ``copies`` of ``job`` for a retry."""
+    log(
+        f'Order({order["id"]}) item {job["item"]["id"]} failed to print, trying again later'
+        f' ({traceback.format_exc()})',
+        order_id=order['id'],
+        item_id=job['item']['id'],
+        error=str(error),
+    )
+    count('print_retries_total', stage='job')
+    fail_jobs(order['id'], job['item']['id'], copies, str(error))
+
+
+def hotfolder_usage(hotfolder_path: str) -> tuple[int, int]:
+    """Return the number and total size of the PDFs waiting in ``hotfolder_path``."""
+    files = size = 0
+    with os.scandir(hotfolder_path) as entries:
+        for entry in entries:
+            # Hidden files are deliveries that are still being written
+            if entry.name.startswith('.') or not entry.name.lower().endswith('.pdf'):
+                continue
+            try:
+                size += entry.stat().st_size
+            except FileNotFoundError:
+                # Taken by the RIP in the meantime
+                continue
+            files += 1
+    return files, size
+
+
+def hotfolder_has_room(hotfolder_path: str) -> bool:
+    """Tell whether ``hotfolder_path`` is below ``HOTFOLDER_MAX_FILES`` and ``HOTFOLDER_MAX_BYTES``.
+
+    The RIP scans every file of its hotfolder, so it slows down when too
+    many jobs wait in it. Deliveries are held in the staging area instead.
+    """
+    if not HOTFOLDER_MAX_FILES and not HOTFOLDER_MAX_BYTES:
+        return True
+    files, size = hotfolder_usage(hotfolder_path)
+    gauge('hotfolder_files', files)
+    gauge('hotfolder_bytes', size)
+    return (
+        (not HOTFOLDER_MAX_FILES or files < HOTFOLDER_MAX_FILES)
+        and (not HOTFOLDER_MAX_BYTES or size < HOTFOLDER_MAX_BYTES)
+    )
+
+
+def _deliver_job(order: dict, job: dict, hotfolder_path: str, copy_mode: str) -> None:
+    """Put the due copies of a rendered ``job`` into the hotfolder, one by one.
+
+    Every delivered copy is recorded right away, so a restart continues with
+    the next copy. While the hotfolder is full, or an order that goes first
+    is waiting for room, the remaining copies are held and tried again
+    after ``HOTFOLDER_POLL`` seconds. The staged file is removed once all
+    copies are delivered.
+    """
+    order_id, item_id = order['id'], job['item']['id']
+    if copy_mode == 'multipage':
+        # All copies are pages of a single file
+        deliveries = [(job['copy_numbers'], f"final_{order_id}_{item_id}.pdf")]
+    else:
+        deliveries = [
+            ([copy], f"final_{order_id}_{item_id}_{copy}.pdf" if copy else f"final_{order_id}_{item_id}.pdf")
+            for copy in job['copy_numbers']
+        ]
+
+    remaining = list(job['copy_numbers'])
+    try:
+        for copies, name in deliveries:
+            if not holds_claim(order_id, item_id):
+                # Our lease ran out and another worker took over the item
+                log(f'Order({order_id}) item {item_id} was claimed by another worker', order_id=order_id)
+                return
+            if not hotfolder_has_room(hotfolder_path) or held_ahead(order_id):
+                hold_jobs(order_id, item_id, remaining)
+                count('hotfolder_holds_total')
+                return
+            # A hardlink appears at once, a copy is renamed into place
+            _link_or_copy(job['staged_path'], os.path.join(hotfolder_path, name))
+            deliver_jobs(order_id, item_id, copies)
+            remaining = remaining[len(copies):]
+    except Exception as error:
+        _job_failed(order, job, remaining, error)
+        return
+
+    if all(other['state'] == 'delivered' for other in get_jobs(order_id) if other['item_id'] == item_id):
+        os.remove(job['staged_path'])
+
+
+def print_item(
+    order: dict,
+    order_item: dict,
+    png_data: bytes,
+    dpi: int,
+    cut_file: str | None,
+    label_settings: dict,
+    hotfolder_path: str,
+    copies: int = 1,
+    copy_mode: str = 'files',
+) -> None:
+    """Render a downloaded item in memory and deliver it to the hotfolder.
+
+    Runs inside the render process pool, so everything that needs the
+    WooCommerce API (``dpi``, ``cut_file``) is resolved by the caller.
+    """
+    if not cut_file:
+        raise Exception('Cut file not found')
+
+    doc = render_item(png_data, dpi, order, label_settings, cut_file)
+    deliver_item(doc, order, order_item, hotfolder_path, copies, copy_mode)
+    doc.close()
+
+
+def _print_item_in_worker(*args) -> dict:
+    """Run ``print_item`` in a worker process and return its metrics."""
+    print_item(*args)
+    return drain_metrics()
+
+
+# Worker pools shared by all orders, created on first use
+_EXECUTORS: dict[str, Executor] = {}
+# Settings of the main process that render workers need. Workers are
+# spawned, not forked, so they start from the module defaults.
+RENDER_SETTINGS = (
+    'FLATE_COMPRESS_LEVEL',
+    'PDF_IMAGE_ENCODING',
+    'PDF_JPEG_QUALITY',
+    'PDF_AUTO_JPEG_RATIO',
+    'PDF_OPTIMIZE',
+    'JSON_LOGS',
+)
+RENDER_TIMEOUT = 600  # seconds a single render may take before its pool is replaced
+
+
+def _init_render_worker(settings: dict, cwd: str) -> None:
+    """Apply the ``RENDER_SETTINGS`` and working directory of the main process in a render worker."""
+    globals().update(settings)
+    # Staging, cut and font paths may be relative
+    os.chdir(cwd)
+
+
+def _get_executor(kind: str, max_workers: int) -> Executor:
+    """Return the shared ``"render"`` process pool."""
+    initargs = ({name: globals()[name] for name in RENDER_SETTINGS}, os.getcwd())
+    executor = _EXECUTORS.get(kind)
+    if executor is not None and (
+        executor._max_workers != max_workers
+        or getattr(executor, '_broken', False)
+        or executor._initargs != initargs
+    ):
+        executor.shutdown(wait=False)
+        executor = None
+    if executor is None:
+        # Forking would copy locks held by the I/O, heartbeat and server threads
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_render_worker,
+            initargs=initargs,
+        )
+        _EXECUTORS[kind] = executor
+    return executor
+
+
+def _discard_executor(kind: str) -> None:
+    """Stop the workers of a pool that hangs, the next use starts a new one."""
+    executor = _EXECUTORS.pop(kind, None)
+    if executor is not None:
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def print_order(
+    order: dict,
+    label_settings: dict,
+    hotfolder_path: str,
+    url: str,
+    max_workers: int = 1,
+    copy_mode: str = 'files',
+) -> None:
+    """Download, render and deliver every due copy of every item of ``order``.
+
+    The progress of every copy is kept in the ``jobs`` table, so an
+    interrupted order continues where it stopped. An item that fails does
+    not hold up the others: its jobs are scheduled for a later retry and
+    picked up again by ``run_due_jobs``. Only the jobs this worker can
+    claim are printed, see ``claim_jobs``.
+
+    With ``max_workers`` greater than one, all items are downloaded
+    concurrently on the I/O loop while rasterising and merging run in a
+    process pool sized to the CPU count (but never above ``max_workers``).
+    See ``deliver_item`` for ``copy_mode``.
+    """
+    enqueue_order(order)
+    os.makedirs(STAGING_PATH, exist_ok=True)
+    try:
+        _print_claimed_jobs(order, _print_jobs(order, url), label_settings, hotfolder_path, max_workers, copy_mode)
+    finally:
+        release_jobs(order['id'])
+    _finish_order(order)
+
+
+def _print_claimed_jobs(
+    order: dict,
+    jobs: list[dict],
+    label_settings: dict,
+    hotfolder_path: str,
+    max_workers: int,
+    copy_mode: str,
+) -> None:
+    """Download, render and deliver the claimed ``jobs`` of ``order``."""
+    # Items are rendered once; a staged file is only there when that worked
+    renders = [job for job in jobs if not os.path.exists(job['staged_path'])]
+    failed = set()
+
+    for job in renders:
+        set_job_state(order['id'], job['item']['id'], job['copy_numbers'], 'downloading')
+
+    if max_workers <= 1:
+        for job in renders:
+            try:
+                png_data = fetch_image(job['png_url'])
+                args = _render_args(order, job, png_data, label_settings, copy_mode)
+                key = _render_job_key(args)
+                if not load_render(key, job['staged_path']):
+                    print_item(*args)
+                    store_render(key, job['staged_path'])
+                set_job_state(order['id'], job['item']['id'], job['copy_numbers'], 'rendered')
+            except Exception as error:
+                failed.add(job['item']['id'])
+                _job_failed(order, job, job['copy_numbers'], error)
+    elif renders:
+        workers = min(max_workers, os.cpu_count() or 1)
+        render_pool = _get_executor('render', workers)
+        # Only as many artworks as there are workers are downloaded or
+        # rendered at a time, the rest wait for one of them to finish
+        waiting = iter(renders)
+        downloads, rendering = {}, {}
+
+        def download_next():
+            job = next(waiting, None)
+            if job is not None:
+                downloads[submit_io(fetch_image_async(job['png_url']))] = job
+
+        for _ in range(workers):
+            download_next()
+        try:
+            while downloads or rendering:
+                done, _ = wait([*downloads, *rendering], RENDER_TIMEOUT, FIRST_COMPLETED)
+                if not done and rendering:
+                    # The renders fail with a broken pool and are retried later
+                    _discard_executor('render')
+                    render_pool = _get_executor('render', workers)
+                for future in done:
+                    if future in downloads:
+                        job = downloads.pop(future)
+                        try:
+                            args = _render_args(order, job, future.result(), label_settings, copy_mode)
+                            key = _render_job_key(args)
+                            if not load_render(key, job['staged_path']):
+                                rendering[render_pool.submit(_print_item_in_worker, *args)] = (job, key)
+                                continue
+                            set_job_state(order['id'], job['item']['id'], job['copy_numbers'], 'rendered')
+                        except Exception as error:
+                            failed.add(job['item']['id'])
+                            _job_failed(order, job, job['copy_numbers'], error)
+                    else:
+                        job, key = rendering.pop(future)
+                        try:
+                            merge_metrics(future.result())
+                            store_render(key, job['staged_path'])
+                            set_job_state(order['id'], job['item']['id'], job['copy_numbers'], 'rendered')
+                        except Exception as error:
+                            failed.add(job['item']['id'])
+                            _job_failed(order, job, job['copy_numbers'], error)
+                    download_next()
+        finally:
+            # Never leave work of a failed attempt running into the next one
+            for future in downloads:
+                future.cancel()
+            wait([*downloads, *rendering])
+
+    for job in jobs:
+        if job['item']['id'] not in failed:
+            _deliver_job(order, job, hotfolder_path, copy_mode)
+
+
+def run_due_jobs(
+    label_settings: dict,
+    hotfolder_path: str,
+    url: str,
+    max_workers: int = 1,
+    copy_mode: str = 'files',
+) -> None:
+    """Continue every queued order whose jobs are ready to run again.
+
+    Covers retries whose backoff has passed, orders that were interrupted
+    by a restart and copies held while the hotfolder was full.
+    """
+    resolve_affinities()
+    for order in get_due_orders():
+        print_order(order, label_settings, hotfolder_path, url, max_workers, copy_mode)
+    with _DB_LOCK:
+        held = get_db().execute("SELECT COUNT(*) FROM jobs WHERE state = 'held'").fetchone()[0]
+    gauge('held_jobs', held)
+
+
+# sync_state key of the newest date_modified_gmt that has been processed
+ORDERS_MODIFIED_AFTER = 'orders_modified_after'
+# How far back the first incremental sync of an empty database looks, in seconds
+ORDER_SYNC_LOOKBACK = 24 * 3600
+
+
+async def _get_orders_page_async(woocommerce_api: API, params: dict | None = None, attempts: int = 3):
+    """Request one page of orders, retrying on unexpected responses.
+
+    Returns the HTTP response together with its decoded list of orders.
+    """
     orders_response = None
     for _ in range(attempts):
-        orders_response = woocommerce_api.get('orders').json()
+        response = await api_get(woocommerce_api, 'orders', params)
+        orders_response = response.json()
         if isinstance(orders_response, list):
-            break
-        print(
+            return response, orders_response
+        log(
             f"Unexpected response from WooCommerce API: {orders_response},"
             " retrying...",
         )
-        time.sleep(5)
+        count('print_retries_total', stage='woocommerce_api')
+        await asyncio.sleep(API_RETRY_DELAY)
+    raise ValueError(f"Unexpected response from WooCommerce API: {orders_response}")
+
+
+def _get_orders_page(woocommerce_api: API, params: dict | None = None, attempts: int = 3):
+    """Blocking wrapper around ``_get_orders_page_async``."""
+    return run_io(_get_orders_page_async(woocommerce_api, params, attempts))
+
+
+def initial_modified_after() -> str:
+    """Return where the first incremental sync starts.
+
+    That is the time the newest stored order was printed, or
+    ``ORDER_SYNC_LOOKBACK`` seconds ago for an empty database, so the
+    first sync never prints the whole order history of the shop.
+    """
+    with _DB_LOCK:
+        newest = get_db().execute("SELECT MAX(created_at) FROM orders").fetchone()[0]
+    if newest:
+        return newest.replace(' ', 'T')
+    since = datetime.fromtimestamp(time.time() - ORDER_SYNC_LOOKBACK, timezone.utc)
+    return since.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def fetch_orders(woocommerce_api: API, modified_after: str | None = None) -> tuple[list[dict], bool]:
+    """Fetch all paid orders modified after ``modified_after``.
+
+    Follows the ``X-WP-TotalPages`` pagination of the WooCommerce API.
+    ``modified_after`` is a GMT timestamp as found in ``date_modified_gmt``.
+    Returns the orders and whether the listing was complete, i.e. no order
+    slipped between two pages because it was modified while paging.
+    """
+    params = {
+        'status': 'processing,completed',
+        'per_page': 100,
+        'orderby': 'modified',
+        'order': 'asc',
+    }
+    if modified_after:
+        # Orders modified within the same second may not have been seen yet
+        since = datetime.fromisoformat(modified_after) - timedelta(seconds=1)
+        params['modified_after'] = since.isoformat()
+        params['dates_are_gmt'] = 'true'
+
+    # The first page tells how many there are, the others are fetched concurrently
+    response, page_orders = _get_orders_page(woocommerce_api, dict(params, page=1))
+    total = int(response.headers.get('X-WP-Total') or len(page_orders))
+    total_pages = int(response.headers.get('X-WP-TotalPages') or 1)
+    pages = [page_orders] + [
+        page_orders for _, page_orders in gather_io(
+            _get_orders_page_async(woocommerce_api, dict(params, page=page))
+            for page in range(2, total_pages + 1)
+        )
+    ]
+
+    orders = {}
+    for page_orders in pages:
+        for order in page_orders:
+            orders[order['id']] = order
+    return list(orders.values()), len(orders) >= total
+
+
+def process_orders(
+    orders: list[dict],
+    label_settings: dict,
+    hotfolder_path: str,
+    url: str,
+    max_workers: int = 1,
+    copy_mode: str = 'files',
+) -> None:
+    """Print every paid order of ``orders`` that has not been printed yet."""
+    # Skip orders that have not been paid yet
+    paid_orders = [
+        order for order in orders
+        if order.get('status') in {"processing", "completed"}
+    ]
+    known_order_ids = get_known_order_ids([order['id'] for order in paid_orders])
+    product_ids = {
+        item['product_id']
+        for order in paid_orders if order['id'] not in known_order_ids
+        for item in order['line_items'] if 'product_id' in item
+    }
+    if product_ids:
+        try:
+            prefetch_products(product_ids)
+        except Exception as error:
+            # Products are fetched one by one when they are needed
+            log(f'Failed to prefetch products: {error}')
+    for order in paid_orders:
+        if order['id'] not in known_order_ids:
+            print_order(order, label_settings, hotfolder_path, url, max_workers, copy_mode)
+
+
+def reprint_orders(woocommerce_api: API, order_ids: list[int]) -> None:
+    """Fetch the orders the dashboard asked to reprint and queue them again."""
+    for order_id in order_ids:
+        try:
+            order = run_io(api_get(woocommerce_api, f"orders/{order_id}")).json()
+            if not isinstance(order, dict) or 'id' not in order:
+                raise ValueError(f"Unexpected response from WooCommerce API: {order}")
+            reprint_order(order)
+        except Exception as error:
+            log(f'Order({order_id}) could not be reprinted: {error}', order_id=order_id)
+
+
+def order_check(
+    woocommerce_api: API,
+    label_settings: dict,
+    hotfolder_path: str,
+    url: str,
+    max_workers: int = 1,
+    copy_mode: str = 'files',
+    incremental: bool = False,
+) -> None:
+    """Print all paid orders that have not been printed yet.
+
+    With ``incremental`` only orders modified since the last successful
+    check are requested from the shop.
+    """
+    if incremental:
+        modified_after = get_sync_state(ORDERS_MODIFIED_AFTER)
+        if modified_after is None:
+            modified_after = initial_modified_after()
+            set_sync_state(ORDERS_MODIFIED_AFTER, modified_after)
+            log(f'First incremental order sync, starting at {modified_after}')
+        orders_response, complete = fetch_orders(woocommerce_api, modified_after)
     else:
-        raise ValueError(f"Unexpected response from WooCommerce API: {orders_response}")
-    for order in orders_response:
-        # Skip orders that have not been paid yet
-        if order.get('status') not in {"processing", "completed"}:
+        _, orders_response = _get_orders_page(woocommerce_api)
+    process_orders(orders_response, label_settings, hotfolder_path, url, max_workers, copy_mode)
+
+    if incremental:
+        modified = [order['date_modified_gmt'] for order in orders_response if order.get('date_modified_gmt')]
+        if complete and modified:
+            set_sync_state(ORDERS_MODIFIED_AFTER, max(modified))
+        elif not complete:
+            log('Orders changed while paging, checking them again next time')
+
+
+MM_TO_PT = 72 / 25.4
+FINAL_FILE_NAME = re.compile(r'final_(\d+)_(\d+)(?:_(\d+))?\.pdf')
+
+
+def shelf_pack(
+    sizes: list[tuple[float, float]],
+    sheet_width: float,
+    sheet_height: float,
+    gap: float = 0,
+) -> list[tuple[int, float, float, bool] | None]:
+    """Place rectangles of ``sizes`` on as few sheets as possible.
+
+    Uses the shelf algorithm: the rectangles are sorted by height and
+    placed left to right on rows ("shelves"), starting a new shelf when a
+    row is full and a new sheet when a sheet is full. A rectangle is
+    rotated by 90 degrees when that is the only way it fits the sheet
+    width. Returns ``(sheet, x, y, rotated)`` for every rectangle, in the
+    order of ``sizes``, or ``None`` for rectangles larger than a sheet.
+    """
+    placements: list[tuple[int, float, float, bool] | None] = [None] * len(sizes)
+    items = []
+    for index, (width, height) in enumerate(sizes):
+        if width <= sheet_width and height <= sheet_height:
+            items.append((index, width, height, False))
+        elif height <= sheet_width and width <= sheet_height:
+            items.append((index, height, width, True))
+    items.sort(key=lambda item: item[2], reverse=True)
+
+    sheet, x, y, shelf_height = 0, 0.0, 0.0, 0.0
+    for index, width, height, rotated in items:
+        if x + width > sheet_width:
+            x, y, shelf_height = 0.0, y + shelf_height + gap, 0.0
+        if y + height > sheet_height:
+            sheet, x, y, shelf_height = sheet + 1, 0.0, 0.0, 0.0
+        placements[index] = (sheet, x, y, rotated)
+        x += width + gap
+        shelf_height = max(shelf_height, height)
+    return placements
+
+
+def impose_pending(staging_path: str, hotfolder_path: str, settings: dict, force: bool = False) -> str | None:
+    """Gang the finished items waiting in ``staging_path`` onto shared sheets.
+
+    Items are collected until ``settings['max_items']`` pages are waiting
+    or the oldest one has waited ``settings['window']`` seconds (or
+    ``force`` is set). They are then placed on sheets of
+    ``settings['sheet_width_mm']`` x ``settings['sheet_height_mm']`` with
+    ``settings['gap_mm']`` between them and written to the hotfolder as
+    one multi-page PDF. Every item page is placed whole, so its cut
+    contour stays aligned with the artwork. A JSON manifest mapping the
+    positions back to orders and items is written to
+    ``staging_path/manifests``. Items larger than a sheet are delivered
+    as they are. Returns the path of the sheet PDF, if one was written.
+    """
+    files = []
+    for name in os.listdir(staging_path):
+        match = FINAL_FILE_NAME.fullmatch(name)
+        if match:
+            path = os.path.join(staging_path, name)
+            files.append((os.path.getmtime(path), name, path, match))
+    if not files:
+        return None
+    files.sort()
+
+    pages = []
+    for _, name, path, match in files:
+        doc = fitz.open(path)
+        for page in doc:
+            pages.append({
+                'doc': doc,
+                'page': page.number,
+                'source': name,
+                'order_id': int(match.group(1)),
+                'item_id': int(match.group(2)),
+                'copy': int(match.group(3) or 0) + page.number,
+                'size': (page.rect.width, page.rect.height),
+            })
+        if len(pages) >= settings['max_items']:
+            break
+    if not force and len(pages) < settings['max_items'] and time.time() - files[0][0] < settings['window']:
+        for doc in {id(page['doc']): page['doc'] for page in pages}.values():
+            doc.close()
+        return None
+
+    sheet_width = settings['sheet_width_mm'] * MM_TO_PT
+    sheet_height = settings['sheet_height_mm'] * MM_TO_PT
+    placements = shelf_pack(
+        [page['size'] for page in pages], sheet_width, sheet_height, settings['gap_mm'] * MM_TO_PT
+    )
+
+    sheets = fitz.open()
+    manifest = []
+    for page, placement in zip(pages, placements):
+        if placement is None:
             continue
-        if get_order_status(order) == False:
-            error_attemps = 0
-            while True:
+        sheet, x, y, rotated = placement
+        while len(sheets) <= sheet:
+            sheets.new_page(width=sheet_width, height=sheet_height)
+        width, height = page['size']
+        if rotated:
+            width, height = height, width
+        rect = fitz.Rect(x, y, x + width, y + height)
+        sheets[sheet].show_pdf_page(rect, page['doc'], page['page'], rotate=90 if rotated else 0)
+        manifest.append({
+            'sheet': sheet + 1,
+            'rect': [round(value, 2) for value in rect],
+            'rotated': rotated,
+            'order_id': page['order_id'],
+            'item_id': page['item_id'],
+            'copy': page['copy'],
+            'source': page['source'],
+        })
+
+    sources = {page['source']: page['doc'] for page in pages}
+    oversized = {page['source'] for page, placement in zip(pages, placements) if placement is None}
+    sheet_path = None
+    if manifest:
+        sheet_name = f"sheet_{datetime.now():%Y%m%d_%H%M%S_%f}"
+        manifest_dir = os.path.join(staging_path, 'manifests')
+        os.makedirs(manifest_dir, exist_ok=True)
+        with open(os.path.join(manifest_dir, f"{sheet_name}.json"), 'w') as manifest_file:
+            json.dump({'sheet_file': f"{sheet_name}.pdf", 'items': manifest}, manifest_file, indent=2)
+        sheet_path = os.path.join(hotfolder_path, f"{sheet_name}.pdf")
+        save_pdf_atomic(sheets, sheet_path, **pdf_save_options())
+    sheets.close()
+
+    for source, doc in sources.items():
+        doc.close()
+        path = os.path.join(staging_path, source)
+        if source in oversized:
+            _copy_atomic(path, os.path.join(hotfolder_path, source))
+        os.remove(path)
+    return sheet_path
+
+
+# Orders received through webhooks, waiting to be printed
+ORDER_QUEUE: queue.Queue = queue.Queue()
+
+WEBHOOK_TOPICS = {'order.created', 'order.updated'}
+
+
+def verify_webhook_signature(body: bytes, signature: str | None, secret: str) -> bool:
+    """Check the ``X-WC-Webhook-Signature`` header of a WooCommerce webhook.
+
+    WooCommerce signs the raw body with HMAC-SHA256 and sends the base64
+    encoded digest.
+    """
+    if not signature or not secret:
+        return False
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), signature)
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Accept signed WooCommerce order webhooks and queue their orders.
+
+    The server is expected to provide ``webhook_secret`` and ``order_queue``
+    attributes, see ``start_webhook_server``.
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        topic = self.headers.get('X-WC-Webhook-Topic')
+
+        # WooCommerce pings a new webhook with an unsigned form body
+        if topic is None:
+            self._respond(200)
+            return
+        if not verify_webhook_signature(
+            body, self.headers.get('X-WC-Webhook-Signature'), self.server.webhook_secret
+        ):
+            self._respond(401)
+            return
+        if topic not in WEBHOOK_TOPICS:
+            self._respond(202)
+            return
+        try:
+            order = json.loads(body)
+        except ValueError:
+            self._respond(400)
+            return
+        if not isinstance(order, dict) or 'id' not in order:
+            self._respond(400)
+            return
+
+        self.server.order_queue.put(order)
+        self._respond(202)
+
+    def _respond(self, status: int):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def start_webhook_server(
+    host: str,
+    port: int,
+    secret: str,
+    order_queue: queue.Queue = ORDER_QUEUE,
+) -> ThreadingHTTPServer:
+    """Serve the webhook receiver on a background thread.
+
+    Use port ``0`` to bind a free port, ``server.server_address`` holds the
+    actual address.
+    """
+    server = ThreadingHTTPServer((host, port), WebhookHandler)
+    server.webhook_secret = secret
+    server.order_queue = order_queue
+    threading.Thread(target=server.serve_forever, name='webhook', daemon=True).start()
+    return server
+
+
+# Cleared by the dashboard's stop button, the main loop waits until it is set again
+PRINTING = threading.Event()
+PRINTING.set()
+
+EVENT_QUEUE_SIZE = 256  # events buffered per dashboard before it has to reload
+EVENT_KEEPALIVE = 15  # seconds between two comments on an idle event stream
+DASHBOARD_FILE = 'index.html'
+
+# One queue of (event, data) per connected dashboard, see publish
+_SUBSCRIBERS: set[queue.Queue] = set()
+_SUBSCRIBERS_LOCK = threading.Lock()
+
+
+def subscribe() -> queue.Queue:
+    events = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+    with _SUBSCRIBERS_LOCK:
+        _SUBSCRIBERS.add(events)
+    return events
+
+
+def unsubscribe(events: queue.Queue) -> None:
+    with _SUBSCRIBERS_LOCK:
+        _SUBSCRIBERS.discard(events)
+
+
+def publish(event: str, data: dict) -> None:
+    """Send ``event`` to every connected dashboard.
+
+    A dashboard that does not keep up is dropped; its browser reconnects
+    and loads the current state again.
+    """
+    with _SUBSCRIBERS_LOCK:
+        subscribers = list(_SUBSCRIBERS)
+    for events in subscribers:
+        try:
+            events.put_nowait((event, data))
+        except queue.Full:
+            unsubscribe(events)
+
+
+def set_printing(running: bool) -> None:
+    """Start or stop the order loop of this process."""
+    if running:
+        PRINTING.set()
+    else:
+        PRINTING.clear()
+    log(f'Printing {"started" if running else "stopped"}')
+    publish('state', {'running': running})
+
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    """Serve the dashboard page and its API.
+
+    ``GET /api/orders`` returns a page of ``list_orders`` (query parameters
+    ``status``, ``since``, ``until``, ``after`` and ``limit``) and, on the
+    first page, the orders that are printing. ``GET /api/events`` streams
+    order and state changes as Server-Sent Events. ``POST /api/start``,
+    ``/api/stop`` and ``/api/orders/<id>/reprint`` control printing. They
+    only accept JSON requests from the dashboard's own origin, which other
+    web pages open in the browser cannot send.
+
+    The server is expected to provide an ``order_queue`` attribute, see
+    ``start_dashboard_server``.
+    """
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path in ('/', '/index.html'):
+            self._send_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), DASHBOARD_FILE))
+        elif path == '/api/orders':
+            self._list_orders(parse_qs(query))
+        elif path == '/api/state':
+            self._send_json(200, {'running': PRINTING.is_set()})
+        elif path == '/api/events':
+            self._stream_events()
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        # Browsers send a cross-site form or no-cors request without
+        # preflight, but never with a JSON content type
+        origin = self.headers.get('Origin')
+        if origin is not None and origin != f"http://{self.headers.get('Host')}":
+            self._send_json(403, {'error': 'cross-origin request'})
+            return
+        if self.headers.get_content_type() != 'application/json':
+            self._send_json(415, {'error': 'expected application/json'})
+            return
+        path = self.path.partition('?')[0]
+        if path in ('/api/start', '/api/stop'):
+            set_printing(path == '/api/start')
+            self._send_json(200, {'running': PRINTING.is_set()})
+            return
+        match = re.fullmatch(r'/api/orders/(\d+)/reprint', path)
+        if match is None:
+            self._send_json(404, {'error': 'not found'})
+            return
+        # The main loop owns the jobs, it fetches the order and reprints it
+        order_id = int(match.group(1))
+        self.server.order_queue.put({'id': order_id, 'reprint': True})
+        self._send_json(202, {'id': order_id})
+
+    def _list_orders(self, query: dict):
+        params = {key: values[-1] for key, values in query.items()}
+        try:
+            limit = min(int(params.get('limit') or DASHBOARD_PAGE_SIZE), DASHBOARD_MAX_PAGE_SIZE)
+            if params.get('status') == 'printing':
+                self._send_json(200, {'orders': list_printing_orders(), 'next': None})
+                return
+            orders, cursor = list_orders(
+                params.get('status') or None,
+                params.get('since') or None,
+                params.get('until') or None,
+                params.get('after') or None,
+                limit,
+            )
+        except ValueError as error:
+            self._send_json(400, {'error': str(error)})
+            return
+        response = {'orders': orders, 'next': cursor}
+        if not params.get('after') and not params.get('status'):
+            response['printing'] = list_printing_orders()
+        self._send_json(200, response)
+
+    def _stream_events(self):
+        events = subscribe()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(f"event: state\ndata: {json.dumps({'running': PRINTING.is_set()})}\n\n".encode())
+            self.wfile.flush()
+            while events in _SUBSCRIBERS:
                 try:
-                    for item in order['line_items']:
-                        copies = item.get('quantity', 1)
-                        for copy_index in range(copies):
-                            suffix = f"_{copy_index}" if copies > 1 else ""
-                            png_url = (
-                                f"{url}/Order/order-{order['id']}/item-{item['id']}.png"
-                            )
-                            png_path = f"temp/{order['id']}_{item['id']}{suffix}.png"
-                            pdf_path = f"temp/{order['id']}_{item['id']}{suffix}.pdf"
-                            download_image(png_url, png_path)
-                            dpi = get_print_dpi(item)
-                            png_to_pdf(png_path, pdf_path, dpi)
-                            start_printing(
-                                order,
-                                item,
-                                pdf_path,
-                                label_settings,
-                                hotfolder_path,
-                                copy_index if copies > 1 else 0,
-                            )
-                            os.remove(png_path)
-                    if get_order(order):
-                        update_order(order, True)
-                    else:
-                        save_order(order, True)
-                    print(f'Order({order["id"]}) completed')
-                    break
-                except Exception as error:
-                    print(f'Order({order["id"]}) failed to print, try again... ({traceback.format_exc()})')
-                    error_attemps += 1
-                    time.sleep(5)
-
-                if error_attemps >= 3:
-                    if not get_order(order):
-                        save_order(order, -1)
-                    else:
-                        update_order(order, -1)
-                    print(f'Order({order["id"]}) failed to print')
-                    break
+                    event, data = events.get(timeout=EVENT_KEEPALIVE)
+                    chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                except queue.Empty:
+                    chunk = ": keepalive\n\n"
+                self.wfile.write(chunk.encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            unsubscribe(events)
+
+    def _send_file(self, path: str):
+        with open(path, 'rb') as file:
+            body = file.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_dashboard_server(
+    host: str,
+    port: int,
+    order_queue: queue.Queue = ORDER_QUEUE,
+) -> ThreadingHTTPServer:
+    """Serve the dashboard on a background thread.
+
+    Anyone who can reach the server can stop printing, keep ``host`` local.
+    Use port ``0`` to bind a free port, ``server.server_address`` holds the
+    actual address.
+    """
+    server = ThreadingHTTPServer((host, port), DashboardHandler)
+    server.order_queue = order_queue
+    threading.Thread(target=server.serve_forever, name='dashboard', daemon=True).start()
+    return server
+
+
+def wait_for_orders(order_queue: queue.Queue, timeout: float) -> list[dict]:
+    """Wait up to ``timeout`` seconds for queued orders and return all of them.
+
+    An order that was queued several times (e.g. created and updated) is
+    only returned once, in its most recent version. Reprint requests from
+    the dashboard (``{'id': ..., 'reprint': True}``) are kept apart from
+    the orders.
+    """
+    orders = {}
+    try:
+        order = order_queue.get(timeout=max(timeout, 0))
+    except queue.Empty:
+        return []
+    orders[order['id'], bool(order.get('reprint'))] = order
+    while True:
+        try:
+            order = order_queue.get_nowait()
+        except queue.Empty:
+            return list(orders.values())
+        orders[order['id'], bool(order.get('reprint'))] = order
 
 
 if __name__ == '__main__':
     load_dotenv(override=True)
     
     DB_NAME = os.getenv('DB_NAME')
+    DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE') or DB_JOURNAL_MODE
     create_db(DB_NAME)
+
+    # Workers sharing DB_NAME split the jobs between them
+    WORKER_ID = os.getenv('WORKER_ID') or WORKER_ID
+    WORKER_AFFINITY = {
+        print_id.strip() for print_id in (os.getenv('WORKER_AFFINITY') or '').split(',') if print_id.strip()
+    }
+    CLAIM_LEASE = float(os.getenv('CLAIM_LEASE') or CLAIM_LEASE)
+    start_heartbeat()
+    # Jobs that were running when the process stopped start over
+    resume_jobs()
     
     URL = os.getenv('URL')
     CONSUMER_KEY = os.getenv('CONSUMER_KEY')
@@ -389,10 +2972,16 @@ if __name__ == '__main__':
         'sender_street': SENDER_STREET,
         'sender_postalcode': SENDER_POSTALCODE,
         'sender_city': SENDER_CITY,
-        'sender_country': SENDER_COUNTRY
+        'sender_country': SENDER_COUNTRY,
+        'label_mode': os.getenv('LABEL_MODE', 'vector'),
     }
+    # Load the fonts and lay out the sender block before the first order
+    get_label_template(LABEL_SETTINGS)
+
+    HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS') or HTTP_MAX_CONNECTIONS)
+    HTTP_MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST') or HTTP_MAX_PER_HOST)
 
-    WOOCOMMERCE_API = API(
+    WOOCOMMERCE_API = AsyncAPI(
         url=URL,
         consumer_key=CONSUMER_KEY,
         consumer_secret=CONSUMER_SECRET,
@@ -400,16 +2989,125 @@ if __name__ == '__main__':
     )
     
     HOTFOLDER_PATH = os.getenv('HOTFOLDER_PATH')
+
+    PRODUCT_CACHE_TTL = float(os.getenv('PRODUCT_CACHE_TTL') or PRODUCT_CACHE_TTL)
+    PRODUCT_CACHE_SIZE = int(os.getenv('PRODUCT_CACHE_SIZE') or PRODUCT_CACHE_SIZE)
+
+    # Number of copies processed in parallel, defaults to the CPU count
+    PRINT_WORKERS = int(os.getenv('PRINT_WORKERS') or os.cpu_count() or 1)
+    # files: one hotfolder file per copy, multipage: one file with a page per copy
+    COPY_MODE = os.getenv('COPY_MODE', 'files')
+    # incremental: only fetch orders modified since the last check, full: fetch the first page
+    ORDER_SYNC = os.getenv('ORDER_SYNC', 'incremental')
+    ORDER_SYNC_LOOKBACK = float(os.getenv('ORDER_SYNC_LOOKBACK') or ORDER_SYNC_LOOKBACK)
+
+    # With imposition, finished items wait in IMPOSITION_PATH until they fill a sheet
+    IMPOSITION = os.getenv('IMPOSITION') == 'on'
+    IMPOSITION_PATH = os.getenv('IMPOSITION_PATH') or 'temp/imposition'
+    IMPOSITION_SETTINGS = {
+        'sheet_width_mm': float(os.getenv('SHEET_WIDTH_MM') or 1600),
+        'sheet_height_mm': float(os.getenv('SHEET_HEIGHT_MM') or 1000),
+        'gap_mm': float(os.getenv('SHEET_GAP_MM') or 10),
+        'max_items': int(os.getenv('IMPOSITION_MAX_ITEMS') or 20),
+        'window': float(os.getenv('IMPOSITION_WINDOW') or 300),
+    }
+    if IMPOSITION:
+        os.makedirs(IMPOSITION_PATH, exist_ok=True)
+    STAGING_PATH = os.getenv('STAGING_PATH') or STAGING_PATH
+    PDF_OPTIMIZE = (os.getenv('PDF_OPTIMIZE') or 'on') == 'on'
+    PDF_IMAGE_ENCODING = os.getenv('PDF_IMAGE_ENCODING') or PDF_IMAGE_ENCODING
+    PDF_JPEG_QUALITY = int(os.getenv('PDF_JPEG_QUALITY') or PDF_JPEG_QUALITY)
+    PDF_AUTO_JPEG_RATIO = float(os.getenv('PDF_AUTO_JPEG_RATIO') or PDF_AUTO_JPEG_RATIO)
+    HOTFOLDER_MAX_FILES = int(os.getenv('HOTFOLDER_MAX_FILES') or HOTFOLDER_MAX_FILES)
+    if os.getenv('HOTFOLDER_MAX_MB'):
+        HOTFOLDER_MAX_BYTES = int(float(os.getenv('HOTFOLDER_MAX_MB')) * 1024 ** 2)
+    HOTFOLDER_POLL = float(os.getenv('HOTFOLDER_POLL') or HOTFOLDER_POLL)
+    if os.getenv('EXPRESS_SHIPPING'):
+        EXPRESS_SHIPPING = tuple(word.strip() for word in os.getenv('EXPRESS_SHIPPING').split(',') if word.strip())
+    RENDER_CACHE_PATH = os.getenv('RENDER_CACHE_PATH') or RENDER_CACHE_PATH
+    if os.getenv('RENDER_CACHE_MB'):
+        RENDER_CACHE_SIZE = int(float(os.getenv('RENDER_CACHE_MB')) * 1024 ** 2)
+    OUTPUT_PATH = IMPOSITION_PATH if IMPOSITION else HOTFOLDER_PATH
     
+    JSON_LOGS = os.getenv('LOG_FORMAT') == 'json'
+    METRICS_PORT = os.getenv('METRICS_PORT')
+    if METRICS_PORT:
+        start_metrics_server(os.getenv('METRICS_HOST') or '127.0.0.1', int(METRICS_PORT))
+
+    # Webhooks make the regular check a slow safety net
+    WEBHOOK_PORT = os.getenv('WEBHOOK_PORT')
+    POLL_INTERVAL = float(os.getenv('POLL_INTERVAL') or (300 if WEBHOOK_PORT else 5))
+    if WEBHOOK_PORT:
+        start_webhook_server(
+            os.getenv('WEBHOOK_HOST') or '0.0.0.0',
+            int(WEBHOOK_PORT),
+            os.getenv('WEBHOOK_SECRET') or CONSUMER_SECRET,
+        )
+
+    DASHBOARD_PORT = os.getenv('DASHBOARD_PORT')
+    if DASHBOARD_PORT:
+        start_dashboard_server(os.getenv('DASHBOARD_HOST') or '127.0.0.1', int(DASHBOARD_PORT))
+
+    last_check = None
     while True:
+        # Stopped from the dashboard, orders from webhooks wait in ORDER_QUEUE
+        PRINTING.wait()
+        if last_check is None or time.monotonic() - last_check >= POLL_INTERVAL:
+            try:
+                order_check(
+                    WOOCOMMERCE_API,
+                    LABEL_SETTINGS,
+                    OUTPUT_PATH,
+                    URL,
+                    PRINT_WORKERS,
+                    COPY_MODE,
+                    ORDER_SYNC == 'incremental',
+                )
+            except Exception as error:
+                log(str(error))
+            last_check = time.monotonic()
+
+        timeout = POLL_INTERVAL - (time.monotonic() - last_check)
+        if IMPOSITION:
+            timeout = min(timeout, IMPOSITION_SETTINGS['window'])
+        job_due = next_job_due()
+        if job_due is not None:
+            timeout = max(0, min(timeout, job_due - time.time()))
+        orders = wait_for_orders(ORDER_QUEUE, timeout)
+        if not PRINTING.is_set():
+            # Stopped while waiting, the orders are printed after the next start
+            for order in orders:
+                ORDER_QUEUE.put(order)
+            continue
+        reprints = [order['id'] for order in orders if order.get('reprint')]
+        orders = [order for order in orders if not order.get('reprint')]
+        # run_due_jobs below prints them again
+        reprint_orders(WOOCOMMERCE_API, reprints)
+        if orders:
+            try:
+                process_orders(
+                    orders,
+                    LABEL_SETTINGS,
+                    OUTPUT_PATH,
+                    URL,
+                    PRINT_WORKERS,
+                    COPY_MODE,
+                )
+            except Exception as error:
+                log(str(error))
+
         try:
-            order_check(
-                WOOCOMMERCE_API,
-                LABEL_SETTINGS,
-                HOTFOLDER_PATH,
-                URL
-            )
+            run_due_jobs(LABEL_SETTINGS, OUTPUT_PATH, URL, PRINT_WORKERS, COPY_MODE)
         except Exception as error:
-            print(error)
+            log(str(error))
 
-        time.sleep(5)
+        if IMPOSITION:
+            try:
+                sheet_path = None
+                # Items wait in IMPOSITION_PATH while the hotfolder is full
+                if hotfolder_has_room(HOTFOLDER_PATH):
+                    sheet_path = impose_pending(IMPOSITION_PATH, HOTFOLDER_PATH, IMPOSITION_SETTINGS)
+                if sheet_path:
+                    log(f'Sheet {sheet_path} created')
+            except Exception as error:
+                log(str(error))
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+
+@pytest.fixture
+def job_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(run, 'DB_NAME', str(tmp_path / 'orders.db'), raising=False)
+    run.create_db(run.DB_NAME)
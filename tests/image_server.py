@@ -0,0 +1,94 @@
+"""Local HTTP stand-in for the shop's image server.
+
+Serves in-memory files with support for Range requests and lets tests
+inject failures. Used by the download tests and benchmarks.
+"""
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get('Range')))
+            failure = server.failures.pop(0) if server.failures else None
+
+        data = server.files.get(self.path)
+        if data is None:
+            self._send_status(404)
+            return
+        if isinstance(failure, int):
+            self._send_status(failure)
+            return
+
+        start = 0
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        if match and server.support_range:
+            start = int(match.group(1))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if failure == 'truncate':
+            # Announce the full body but drop the connection half way
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        if server.bytes_per_second:
+            for offset in range(0, len(body), 64 * 1024):
+                self.wfile.write(body[offset:offset + 64 * 1024])
+                time.sleep(64 * 1024 / server.bytes_per_second)
+        else:
+            self.wfile.write(body)
+
+    def _send_status(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ImageServer(ThreadingHTTPServer):
+    """Serve ``files`` (path -> bytes) on a free local port.
+
+    ``failures`` is consumed one entry per request: an HTTP status code to
+    answer with, ``"truncate"`` to cut the body off half way, or ``None``
+    to serve the request normally.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, files=None, failures=None, support_range=True, bytes_per_second=None):
+        super().__init__(('127.0.0.1', 0), ImageRequestHandler)
+        self.files = dict(files or {})
+        self.failures = list(failures or [])
+        self.support_range = support_range
+        self.bytes_per_second = bytes_per_second
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
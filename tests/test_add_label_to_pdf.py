@@ -0,0 +1,95 @@
+import os
+import sys
+import pytest
+import fitz
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from run import add_label_to_pdf, get_label_template, label_document, LABEL_MARGIN_PT
+
+
+LABEL_SETTINGS = {
+    'text_font_path': 'fonts/roboto.ttf',
+    'text_bold_font_path': 'fonts/Roboto-Bold.ttf',
+    'text_font_size': '9',
+    'text_sender_pos': '150, 50',
+    'text_receiver_pos': '150, 230',
+    'sender_name': 'Drohnen-Design',
+    'sender_street': 'Herrenstraße 14',
+    'sender_postalcode': '21698',
+    'sender_city': 'Harsefeld',
+    'sender_country': 'Deutschland',
+}
+
+ORDER = {
+    'id': 1,
+    'shipping': {
+        'first_name': 'Erika',
+        'last_name': 'Musterfrau',
+        'address_1': 'Musterstraße 1',
+        'postcode': '12345',
+        'city': 'Köln',
+        'country': 'DE',
+    },
+}
+
+
+def make_input(path):
+    doc = fitz.open()
+    page = doc.new_page(width=400, height=300)
+    page.draw_rect(fitz.Rect(10, 10, 390, 290), color=(1, 0, 0))
+    doc.save(str(path))
+    doc.close()
+
+
+@pytest.mark.parametrize('mode', ['vector', 'raster'])
+def test_add_label_to_pdf_widens_page(tmp_path, mode):
+    input_pdf = tmp_path / 'input.pdf'
+    output_pdf = tmp_path / 'output.pdf'
+    make_input(input_pdf)
+    add_label_to_pdf(str(input_pdf), str(output_pdf), ORDER, dict(LABEL_SETTINGS, label_mode=mode))
+    doc = fitz.open(str(output_pdf))
+    page = doc[0]
+    assert page.rect.width == pytest.approx(400 + LABEL_MARGIN_PT, abs=1)
+    assert page.rect.height == pytest.approx(300, abs=1)
+    doc.close()
+
+
+def test_add_label_to_pdf_vector_writes_text(tmp_path):
+    input_pdf = tmp_path / 'input.pdf'
+    output_pdf = tmp_path / 'output.pdf'
+    make_input(input_pdf)
+    add_label_to_pdf(str(input_pdf), str(output_pdf), ORDER, LABEL_SETTINGS)
+    doc = fitz.open(str(output_pdf))
+    page = doc[0]
+    text = page.get_text(clip=fitz.Rect(0, 0, LABEL_MARGIN_PT, page.rect.height))
+    assert 'Absender:' in text
+    assert 'Erika Musterfrau' in text
+    assert not page.get_images()
+    fonts = {font[3] for font in page.get_fonts()}
+    assert {'Roboto Regular', 'Roboto Bold'} <= fonts
+    doc.close()
+
+
+@pytest.mark.parametrize('mode', ['vector', 'raster'])
+def test_label_template_is_shared_between_orders(tmp_path, mode):
+    settings = dict(LABEL_SETTINGS, label_mode=mode)
+    assert get_label_template(settings) is get_label_template(dict(settings))
+
+    input_pdf = tmp_path / 'input.pdf'
+    make_input(input_pdf)
+    doc = fitz.open(str(input_pdf))
+    other = dict(ORDER, shipping=dict(ORDER['shipping'], first_name='Max', last_name='Mustermann'))
+    first = label_document(doc, ORDER, settings)
+    second = label_document(doc, other, settings)
+
+    # Both labels share the static block but keep their own receiver
+    clip = fitz.Rect(0, 0, LABEL_MARGIN_PT, first[0].rect.height)
+    if mode == 'vector':
+        assert 'Erika Musterfrau' in first[0].get_text(clip=clip)
+        assert 'Max Mustermann' in second[0].get_text(clip=clip)
+        assert 'Absender:' in second[0].get_text(clip=clip)
+    else:
+        assert first[0].get_pixmap(clip=clip).samples != second[0].get_pixmap(clip=clip).samples
+    first.close()
+    second.close()
+    doc.close()
@@ -0,0 +1,46 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+
+SHIPPING = {
+    'first_name': 'Erika',
+    'last_name': 'Musterfrau',
+    'address_1': 'Musterstraße 1',
+    'postcode': '12345',
+    'city': 'Köln',
+    'state': '',
+    'country': 'DE',
+}
+
+
+def test_country_names_are_german():
+    assert run.get_country_name('DE') == 'Deutschland'
+    assert run.get_country_name('AT') == 'Österreich'
+    assert run.get_country_name('GB') == 'Vereinigtes Königreich'
+    assert run.get_country_name('XX') == ''
+
+
+def test_unknown_countries_fall_back_to_pycountry(monkeypatch):
+    monkeypatch.setattr(run, '_country_names', lambda: {})
+    run.get_country_name.cache_clear()
+    try:
+        assert run.get_country_name('FR') == 'France'
+    finally:
+        run.get_country_name.cache_clear()
+
+
+def test_format_address_uses_country_layout():
+    assert run.format_address(SHIPPING) == [
+        'Erika Musterfrau', 'Musterstraße 1', '12345 Köln', 'Deutschland',
+    ]
+    british = dict(SHIPPING, postcode='SW1A 1AA', city='London', country='GB')
+    assert run.format_address(british) == [
+        'Erika Musterfrau', 'Musterstraße 1', 'London', 'SW1A 1AA', 'Vereinigtes Königreich',
+    ]
+    american = dict(SHIPPING, postcode='10001', city='New York', state='NY', country='US')
+    assert run.format_address(american)[2] == 'New York NY 10001'
+    # Missing fields leave no stray blanks
+    assert run.format_address(dict(american, state=None))[2] == 'New York 10001'
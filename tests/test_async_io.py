@@ -0,0 +1,77 @@
+import asyncio
+import base64
+import os
+import sys
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+
+def use_transport(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(run, '_HTTP_CLIENT', client)
+    monkeypatch.setattr(run, '_HOST_LIMITS', {})
+
+
+def test_async_api_matches_woocommerce_requests(monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, json=[{'id': 1}])
+
+    use_transport(monkeypatch, handler)
+    api = run.AsyncAPI(url='https://shop.example', consumer_key='ck', consumer_secret='cs', version='wc/v3')
+
+    response = run.run_io(api.get_async('orders', {'page': 2}))
+
+    assert response.json() == [{'id': 1}]
+    request = seen[0]
+    assert str(request.url) == 'https://shop.example/wp-json/wc/v3/orders?page=2'
+    assert request.headers['authorization'] == 'Basic ' + base64.b64encode(b'ck:cs').decode()
+    assert request.headers['accept'] == 'application/json'
+
+
+def test_requests_per_host_are_limited(monkeypatch):
+    in_flight = {'now': 0, 'max': 0}
+
+    async def handler(request):
+        in_flight['now'] += 1
+        in_flight['max'] = max(in_flight['max'], in_flight['now'])
+        await asyncio.sleep(0.01)
+        in_flight['now'] -= 1
+        return httpx.Response(200, json=[])
+
+    use_transport(monkeypatch, handler)
+    monkeypatch.setattr(run, 'HTTP_MAX_PER_HOST', 2)
+    api = run.AsyncAPI(url='https://shop.example', consumer_key='ck', consumer_secret='cs')
+
+    responses = run.gather_io(api.get_async('orders', {'page': page}) for page in range(1, 7))
+
+    assert len(responses) == 6
+    assert in_flight['max'] == 2
+
+
+def test_fetch_orders_requests_pages_concurrently(monkeypatch):
+    pages = {page: [{'id': page * 10 + index} for index in range(2)] for page in range(1, 5)}
+    in_flight = {'now': 0, 'max': 0}
+
+    async def handler(request):
+        page = int(request.url.params['page'])
+        in_flight['now'] += 1
+        in_flight['max'] = max(in_flight['max'], in_flight['now'])
+        await asyncio.sleep(0.01)
+        in_flight['now'] -= 1
+        return httpx.Response(200, json=pages[page], headers={'X-WP-Total': '8', 'X-WP-TotalPages': '4'})
+
+    use_transport(monkeypatch, handler)
+    api = run.AsyncAPI(url='https://shop.example', consumer_key='ck', consumer_secret='cs')
+
+    orders, complete = run.fetch_orders(api)
+
+    assert sorted(order['id'] for order in orders) == [10, 11, 20, 21, 30, 31, 40, 41]
+    assert complete
+    # Pages 2 to 4 are requested at the same time
+    assert in_flight['max'] == 3
@@ -0,0 +1,48 @@
+import os
+import sys
+import shutil
+
+import fitz
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+CUTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cuts')
+
+
+def test_get_cut_file_picks_up_new_files(monkeypatch, tmp_path):
+    cuts = tmp_path / 'cuts'
+    cuts.mkdir()
+    monkeypatch.setattr(run, 'CUTS_DIR', str(cuts))
+    monkeypatch.setattr(run, 'get_print_id', lambda item: item['print_id'])
+
+    assert run.get_cut_file({'print_id': 'avata.pdf'}) is None
+
+    shutil.copy(os.path.join(CUTS, '1_dji-avata-2-final-cut.pdf'), cuts / 'avata.pdf')
+    # Make sure the directory looks modified even on coarse timestamps
+    os.utime(cuts, ns=(0, os.stat(cuts).st_mtime_ns + 1))
+
+    assert run.get_cut_file({'print_id': 'avata.pdf'}) == f'{cuts}/avata.pdf'
+    assert run.get_cut_file({'print_id': None}) is None
+
+
+def test_open_cut_file_reloads_replaced_file(tmp_path):
+    path = tmp_path / 'cut.pdf'
+    shutil.copy(os.path.join(CUTS, '1_dji-avata-2-final-cut.pdf'), path)
+    run.drain_metrics()
+
+    first = run.open_cut_file(str(path))
+    assert run.open_cut_file(str(path)) is first
+
+    shutil.copy(os.path.join(CUTS, '2_final-mavic-3-pro-cut.pdf'), path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    second = run.open_cut_file(str(path))
+    assert second is not first
+    assert second[0].rect.width == fitz.open(os.path.join(CUTS, '2_final-mavic-3-pro-cut.pdf'))[0].rect.width
+
+    # Render workers hand these back with the other metrics
+    counters = run.drain_metrics()['counters']
+    assert counters[('cut_file_cache_hits_total', ())] == 1
+    assert counters[('cut_file_cache_misses_total', ())] == 2
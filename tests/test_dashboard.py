@@ -0,0 +1,155 @@
+import json
+import os
+import queue
+import sys
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class FakeAPI:
+    def __init__(self, orders):
+        self._orders = orders
+
+    def get(self, endpoint):
+        return FakeResponse(self._orders.get(endpoint, {'code': 'woocommerce_rest_shop_order_invalid_id'}))
+
+
+@pytest.fixture
+def dashboard(job_db):
+    order = {
+        'id': 1002,
+        'number': 'B-1002',
+        'billing': {'company': 'Beispiel AG', 'first_name': 'Erika', 'last_name': 'Musterfrau'},
+        'line_items': [{'id': 1, 'name': 'Mavic 3 Pro', 'quantity': 2}],
+    }
+    order_queue = queue.Queue()
+    server = run.start_dashboard_server('127.0.0.1', 0, order_queue)
+    yield server, order_queue, FakeAPI({'orders/1002': order})
+    server.shutdown()
+    server.server_close()
+    run.PRINTING.set()
+
+
+def request(server, path, method='GET', headers=None):
+    host, port = server.server_address
+    if method == 'POST' and headers is None:
+        headers = {'Content-Type': 'application/json', 'Origin': f'http://{host}:{port}'}
+    data = b'{}' if method == 'POST' else None
+    url = f'http://{host}:{port}{path}'
+    with urllib.request.urlopen(urllib.request.Request(url, data, headers or {}, method=method)) as response:
+        return json.loads(response.read())
+
+
+def add_orders(count):
+    conn = run.get_db()
+    with conn:
+        conn.executemany(
+            "INSERT INTO orders (id, status, created_at) VALUES (?, ?, datetime(1700000000 + ? * 3600, 'unixepoch'))",
+            ((order_id, -1 if order_id % 3 == 0 else 1, order_id) for order_id in range(count)),
+        )
+
+
+def test_list_orders_pages_through_the_history(job_db):
+    add_orders(250)
+
+    seen, cursor = [], None
+    while True:
+        orders, cursor = run.list_orders(after=cursor, limit=100)
+        seen += [order['id'] for order in orders]
+        if cursor is None:
+            break
+    assert seen == list(range(249, -1, -1))
+
+    failed, _ = run.list_orders(status='failed', limit=1000)
+    assert [order['id'] for order in failed] == list(range(249, -1, -3))
+    assert {order['status'] for order in failed} == {'failed'}
+
+    # Order 0 was created on 2023-11-14 22:13 UTC, one order per hour
+    first_day, _ = run.list_orders(until='2023-11-14')
+    assert [order['id'] for order in first_day] == [1, 0]
+    with pytest.raises(ValueError):
+        run.list_orders(status='lost')
+    with pytest.raises(ValueError):
+        run.list_orders(limit=0)
+
+
+def test_status_changes_are_published_to_subscribers(job_db):
+    events = run.subscribe()
+    try:
+        run.upsert_order({'id': 5, 'number': 'B-5', 'billing': {'first_name': 'Hans', 'last_name': 'Beispiel'}}, True)
+        event, data = events.get(timeout=1)
+    finally:
+        run.unsubscribe(events)
+
+    assert event == 'order'
+    assert data['id'] == 5
+    assert data['status'] == 'completed'
+    assert data['number'] == 'B-5'
+    assert data['customer'] == 'Hans Beispiel'
+
+
+def test_dashboard_stops_and_reprints(dashboard, monkeypatch, tmp_path):
+    server, order_queue, api = dashboard
+
+    assert request(server, '/api/stop', 'POST') == {'running': False}
+    assert not run.PRINTING.is_set()
+    assert request(server, '/api/start', 'POST') == {'running': True}
+
+    run.upsert_order({'id': 1002}, True)
+    # A render of the first print still waits in the staging area
+    monkeypatch.setattr(run, 'STAGING_PATH', str(tmp_path))
+    staged = tmp_path / 'final_1002_1.pdf'
+    staged.write_bytes(b'%PDF')
+
+    assert request(server, '/api/orders/1002/reprint', 'POST') == {'id': 1002}
+    requests = run.wait_for_orders(order_queue, 1)
+    assert requests == [{'id': 1002, 'reprint': True}]
+    assert run.get_jobs(1002) == []
+
+    # The main loop fetches the order and queues it again
+    run.reprint_orders(api, [1002])
+    assert {job['state'] for job in run.get_jobs(1002)} == {'queued'}
+    assert not staged.exists()
+
+    page = request(server, '/api/orders')
+    assert page['orders'][0]['status'] == 'printing'
+    assert page['printing'][0]['customer'] == 'Beispiel AG, Erika Musterfrau'
+    assert page['printing'][0]['items'] == '2x Mavic 3 Pro'
+
+
+@pytest.mark.parametrize('limit', ['0', '-5', 'ten'])
+def test_dashboard_rejects_invalid_page_sizes(dashboard, limit):
+    server, _, _ = dashboard
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        request(server, f'/api/orders?limit={limit}')
+
+    assert error.value.code == 400
+
+
+@pytest.mark.parametrize('headers, status', [
+    # A form or no-cors fetch from another page
+    ({'Content-Type': 'text/plain'}, 415),
+    ({'Content-Type': 'application/json', 'Origin': 'https://evil.example'}, 403),
+])
+def test_dashboard_rejects_requests_other_pages_can_send(dashboard, headers, status):
+    server, _, _ = dashboard
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        request(server, '/api/stop', 'POST', headers)
+
+    assert error.value.code == status
+    assert run.PRINTING.is_set()
@@ -1,24 +1,61 @@
+import io
 import os
 import sys
 import pytest
+from PIL import Image
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 import run
+from image_server import ImageServer
 
-class FakeResponse:
-    def __init__(self, status_code):
-        self.status_code = status_code
-    def iter_content(self, chunk_size):
-        yield b"data"
-
-
-def test_download_image_retries(monkeypatch, tmp_path):
-    calls = {"count": 0}
-    def fake_get(url, stream=True):
-        calls["count"] += 1
-        return FakeResponse(404 if calls["count"] == 1 else 200)
-    monkeypatch.setattr(run.requests, "get", fake_get)
-    output = tmp_path / "out.png"
-    run.download_image("http://example.com/image.png", output, retries=2, delay=0)
-    assert output.read_bytes() == b"data"
-    assert calls["count"] == 2
+
+def make_png(width=400, height=300):
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_download_image_retries(tmp_path):
+    png = make_png()
+    with ImageServer({'/image.png': png}, failures=[503]) as server:
+        output = tmp_path / "out.png"
+        run.download_image(f"{server.url}/image.png", output, retries=2, delay=0)
+        assert output.read_bytes() == png
+        assert len(server.requests) == 2
+
+
+def test_fetch_image_resumes_interrupted_download():
+    png = make_png()
+    with ImageServer({'/image.png': png}, failures=['truncate']) as server:
+        assert run.fetch_image(f"{server.url}/image.png", retries=2, delay=0) == png
+        first, second = server.requests
+        assert first[1] is None
+        # Resumes after the data received before the connection dropped
+        offset = int(second[1][len('bytes='):-1])
+        assert 0 < offset <= len(png) // 2
+
+
+def test_fetch_image_restarts_without_range_support():
+    png = make_png()
+    with ImageServer({'/image.png': png}, failures=['truncate'], support_range=False) as server:
+        assert run.fetch_image(f"{server.url}/image.png", retries=2, delay=0) == png
+
+
+def test_fetch_image_rejects_non_png():
+    with ImageServer({'/image.png': b'<html>maintenance</html>'}) as server:
+        with pytest.raises(run.DownloadError, match='not a PNG'):
+            run.fetch_image(f"{server.url}/image.png", retries=2, delay=0)
+        assert len(server.requests) == 2
+
+
+def test_fetch_image_gives_up(tmp_path):
+    with ImageServer({'/image.png': make_png()}, failures=[503, 503]) as server:
+        with pytest.raises(run.DownloadError, match='status code 503'):
+            run.fetch_image(f"{server.url}/image.png", retries=2, delay=0)
+
+
+def test_fetch_image_does_not_retry_missing_images():
+    with ImageServer({'/image.png': make_png()}, failures=[404]) as server:
+        with pytest.raises(run.DownloadError, match='status code 404'):
+            run.fetch_image(f"{server.url}/image.png", retries=5, delay=0)
+        assert len(server.requests) == 1
@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+
+import fitz
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+SETTINGS = {
+    'sheet_width_mm': 1600,
+    'sheet_height_mm': 1000,
+    'gap_mm': 10,
+    'max_items': 3,
+    'window': 300,
+}
+
+
+def stage(path, name, width, height, pages=1):
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=width, height=height)
+        page.draw_rect(page.rect, color=(1, 0, 0))
+    doc.save(str(path / name))
+    doc.close()
+
+
+def test_shelf_pack_fills_rows_and_sheets():
+    placements = run.shelf_pack([(40, 20), (40, 30), (40, 20), (40, 20)], 100, 50, gap=5)
+
+    assert placements == [
+        (0, 45, 0, False),
+        (0, 0, 0, False),
+        (1, 0, 0, False),
+        (1, 45, 0, False),
+    ]
+
+
+def test_shelf_pack_rotates_and_skips_oversized():
+    placements = run.shelf_pack([(30, 90), (200, 200)], 100, 50)
+
+    assert placements == [(0, 0, 0, True), None]
+
+
+def test_impose_pending_waits_for_window(tmp_path):
+    staging = tmp_path / 'staging'
+    hotfolder = tmp_path / 'hotfolder'
+    staging.mkdir()
+    hotfolder.mkdir()
+    stage(staging, 'final_1_10.pdf', 1000, 500)
+
+    assert run.impose_pending(str(staging), str(hotfolder), SETTINGS) is None
+    assert os.listdir(hotfolder) == []
+    assert os.listdir(staging) == ['final_1_10.pdf']
+
+
+def test_impose_pending_writes_sheet_and_manifest(tmp_path):
+    staging = tmp_path / 'staging'
+    hotfolder = tmp_path / 'hotfolder'
+    staging.mkdir()
+    hotfolder.mkdir()
+    stage(staging, 'final_1_10.pdf', 1000, 500, pages=2)
+    stage(staging, 'final_2_20_1.pdf', 1000, 500)
+    stage(staging, 'final_3_30.pdf', 5000, 5000)
+
+    sheet_path = run.impose_pending(str(staging), str(hotfolder), dict(SETTINGS, max_items=10), force=True)
+
+    assert sorted(os.listdir(hotfolder)) == ['final_3_30.pdf', os.path.basename(sheet_path)]
+    assert os.listdir(staging) == ['manifests']
+    sheets = fitz.open(sheet_path)
+    assert sheets[0].rect.width == pytest.approx(1600 * run.MM_TO_PT)
+    assert len(sheets) == 1
+    sheets.close()
+
+    manifest_name = os.path.basename(sheet_path).replace('.pdf', '.json')
+    with open(staging / 'manifests' / manifest_name) as manifest_file:
+        manifest = json.load(manifest_file)
+    items = [(item['order_id'], item['item_id'], item['copy']) for item in manifest['items']]
+    assert sorted(items) == [(1, 10, 0), (1, 10, 1), (2, 20, 1)]
+    assert manifest['sheet_file'] == os.path.basename(sheet_path)
@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+
+@pytest.fixture(autouse=True)
+def worker(job_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(run, 'STAGING_PATH', str(tmp_path / 'staging'))
+    # Rendering is stubbed out, there is nothing to cache
+    monkeypatch.setattr(run, 'RENDER_CACHE_SIZE', 0)
+    monkeypatch.setattr(run, 'WORKER_ID', 'a')
+
+
+def stage(order, item, png_data, dpi, cut_file, label_settings, staging_path, *args):
+    with open(os.path.join(staging_path, f"final_{order['id']}_{item['id']}.pdf"), 'wb') as staged:
+        staged.write(b'%PDF')
+
+
+def test_claimed_jobs_are_not_handed_out_twice(monkeypatch):
+    run.enqueue_order({'id': 1, 'line_items': [{'id': 10, 'quantity': 2}]})
+
+    assert run.claim_jobs(1) == {10: [0, 1]}
+    monkeypatch.setattr(run, 'WORKER_ID', 'b')
+    assert run.claim_jobs(1) == {}
+    assert run.get_due_orders() == []
+
+    # Once the lease of worker a has run out, b takes over
+    later = run.time.time() + run.CLAIM_LEASE + 1
+    monkeypatch.setattr(run.time, 'time', lambda: later)
+    assert run.claim_jobs(1) == {10: [0, 1]}
+    monkeypatch.setattr(run, 'WORKER_ID', 'a')
+    assert not run.holds_claim(1, 10)
+
+
+def test_released_jobs_can_be_claimed_by_others(monkeypatch):
+    run.enqueue_order({'id': 2, 'line_items': [{'id': 20}]})
+    run.claim_jobs(2)
+    run.release_jobs(2)
+
+    monkeypatch.setattr(run, 'WORKER_ID', 'b')
+    assert run.claim_jobs(2) == {20: [0]}
+
+
+def test_jobs_are_partitioned_by_affinity(monkeypatch):
+    print_ids = {100: 'mavic-3', 101: 'mini-4'}
+    monkeypatch.setattr(run, 'get_print_id', lambda item: print_ids[item['product_id']])
+    run.enqueue_order({
+        'id': 3,
+        'line_items': [
+            {'id': 30, 'product_id': 100},
+            {'id': 31, 'product_id': 101},
+            {'id': 32},
+        ],
+    })
+
+    monkeypatch.setattr(run, 'WORKER_AFFINITY', {'mini-4'})
+    # Items without a print id go to any worker
+    assert run.claim_jobs(3) == {31: [0], 32: [0]}
+
+    monkeypatch.setattr(run, 'WORKER_ID', 'b')
+    monkeypatch.setattr(run, 'WORKER_AFFINITY', {'mavic-3'})
+    assert run.claim_jobs(3) == {30: [0]}
+
+
+def test_items_wait_for_their_print_id_when_the_lookup_fails(monkeypatch):
+    def unavailable(item):
+        raise ConnectionError('shop unavailable')
+
+    monkeypatch.setattr(run, 'get_print_id', unavailable)
+    run.enqueue_order({'id': 7, 'line_items': [{'id': 70, 'product_id': 100}]})
+
+    monkeypatch.setattr(run, 'WORKER_AFFINITY', {'mini-4'})
+    run.resolve_affinities()
+    assert run.claim_jobs(7) == {}
+
+    monkeypatch.setattr(run, 'get_print_id', lambda item: 'mavic-3')
+    run.resolve_affinities()
+    assert run.claim_jobs(7) == {}
+    monkeypatch.setattr(run, 'WORKER_AFFINITY', {'mavic-3'})
+    assert run.claim_jobs(7) == {70: [0]}
+
+
+def test_held_jobs_only_hold_back_workers_that_could_claim_them(monkeypatch):
+    print_ids = {100: 'mavic-3', 101: 'mini-4'}
+    monkeypatch.setattr(run, 'get_print_id', lambda item: print_ids[item['product_id']])
+    run.enqueue_order({'id': 4, 'line_items': [{'id': 40, 'product_id': 100}]})
+    run.enqueue_order({'id': 5, 'line_items': [{'id': 50, 'product_id': 101}]})
+    run.enqueue_order({'id': 6, 'line_items': [{'id': 60, 'product_id': 100}]})
+    # The hotfolder of the mavic-3 printer is full
+    run.hold_jobs(4, 40, [0])
+
+    monkeypatch.setattr(run, 'WORKER_AFFINITY', {'mavic-3'})
+    assert run.held_ahead(6)
+    monkeypatch.setattr(run, 'WORKER_ID', 'b')
+    monkeypatch.setattr(run, 'WORKER_AFFINITY', {'mini-4'})
+    assert not run.held_ahead(5)
+
+
+def print_as_worker(worker_id, orders, hotfolder, deliveries):
+    run.WORKER_ID = worker_id
+    run.fetch_image = lambda url: b''
+    run.get_print_dpi = lambda item: 150
+    run.get_cut_file = lambda item: 'cut.pdf'
+    run.print_item = stage
+    link_or_copy = run._link_or_copy
+
+    def record(source, target):
+        link_or_copy(source, target)
+        with open(deliveries, 'a') as log:
+            log.write(f'{worker_id} {os.path.basename(target)}\n')
+
+    run._link_or_copy = record
+    run.process_orders(orders, {}, hotfolder, '')
+    run.run_due_jobs({}, hotfolder, '')
+
+
+def test_workers_sharing_a_database_print_every_copy_once(tmp_path):
+    orders = [
+        {'id': order_id, 'status': 'processing', 'line_items': [{'id': order_id * 10, 'quantity': 3}]}
+        for order_id in range(1, 21)
+    ]
+    deliveries = tmp_path / 'deliveries.log'
+    context = multiprocessing.get_context('fork')
+    workers = [
+        context.Process(target=print_as_worker, args=(worker_id, orders, str(tmp_path), str(deliveries)))
+        for worker_id in ('a', 'b', 'c')
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    delivered = [line.split()[1] for line in deliveries.read_text().splitlines()]
+    assert len(delivered) == len(set(delivered)) == 60
+    assert run.get_known_order_ids(range(1, 21)) == set(range(1, 21))
+    assert run.get_db().execute("SELECT COUNT(*) FROM queued_orders").fetchone() == (0,)
@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+import urllib.request
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    run.drain_metrics()
+    yield
+    run.drain_metrics()
+
+
+def test_timed_records_histogram_and_failures():
+    with run.timed('png_to_pdf'):
+        pass
+    with pytest.raises(ValueError):
+        with run.timed('png_to_pdf'):
+            raise ValueError
+
+    metrics = run.render_metrics()
+
+    assert 'print_stage_duration_seconds_count{stage="png_to_pdf"} 2' in metrics
+    assert 'print_stage_duration_seconds_bucket{stage="png_to_pdf",le="+Inf"} 2' in metrics
+    assert 'print_stage_failures_total{stage="png_to_pdf"} 1' in metrics
+
+
+def test_merge_metrics_adds_worker_snapshot():
+    run.observe('merge_cut_file', 0.2)
+    run.count('print_orders_total', result='completed')
+    snapshot = run.drain_metrics()
+
+    run.observe('merge_cut_file', 0.3)
+    run.merge_metrics(snapshot)
+
+    metrics = run.render_metrics()
+    assert 'print_stage_duration_seconds_count{stage="merge_cut_file"} 2' in metrics
+    assert 'print_stage_duration_seconds_sum{stage="merge_cut_file"} 0.5' in metrics
+    assert 'print_orders_total{result="completed"} 1' in metrics
+
+
+def test_metrics_endpoint():
+    run.count('print_orders_total', result='failed')
+    server = run.start_metrics_server('127.0.0.1', 0)
+    try:
+        host, port = server.server_address
+        with urllib.request.urlopen(f'http://{host}:{port}/metrics') as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert 'print_orders_total{result="failed"} 1' in body
+    assert 'product_cache_hits_total' in body
+
+
+def test_log_json_lines(monkeypatch, capsys):
+    monkeypatch.setattr(run, 'JSON_LOGS', True)
+    run.log('Order(1) completed', order_id=1)
+
+    line = json.loads(capsys.readouterr().out)
+    assert line['message'] == 'Order(1) completed'
+    assert line['order_id'] == 1
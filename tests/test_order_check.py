@@ -3,6 +3,7 @@ import sys
 import pytest
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
 from run import order_check
 
 
@@ -35,14 +36,27 @@ class FakeAPIMulti:
         return FakeResponse(resp)
 
 
+@pytest.fixture(autouse=True)
+def staging(job_db, monkeypatch, tmp_path):
+    monkeypatch.setattr('run.STAGING_PATH', str(tmp_path / 'staging'))
+    # Rendering is stubbed out, there is nothing to cache
+    monkeypatch.setattr('run.RENDER_CACHE_SIZE', 0)
+
+
+def stage(hotfolder_path, order, item):
+    # Stand-in for the rendered file print_item leaves in the staging area
+    with open(os.path.join(hotfolder_path, f"final_{order['id']}_{item['id']}.pdf"), 'wb') as staged:
+        staged.write(b'%PDF')
+
+
 def test_order_check_raises_on_invalid_response(monkeypatch):
     api = FakeAPI({'code': 'error', 'message': 'invalid'})
-    monkeypatch.setattr('run.time.sleep', lambda x: None)
+    monkeypatch.setattr('run.API_RETRY_DELAY', 0)
     with pytest.raises(ValueError):
         order_check(api, {}, '', '')
 
 
-def test_order_check_skips_unpaid_orders(monkeypatch):
+def test_order_check_skips_unpaid_orders(monkeypatch, tmp_path):
     orders = [
         {"id": 1, "status": "pending", "line_items": [{"id": 10}]},
         {"id": 2, "status": "processing", "line_items": [{"id": 20}]},
@@ -50,28 +64,26 @@ def test_order_check_skips_unpaid_orders(monkeypatch):
     api = FakeAPI(orders)
 
     calls = []
-    monkeypatch.setattr('run.get_order_status', lambda order: False)
-    monkeypatch.setattr('run.download_image', lambda url, path: None)
-    monkeypatch.setattr('run.png_to_pdf', lambda png, pdf, dpi: None)
+    monkeypatch.setattr('run.get_known_order_ids', lambda ids: set())
+    monkeypatch.setattr('run.fetch_image', lambda url: b'')
     monkeypatch.setattr('run.get_print_dpi', lambda item: 150)
-    monkeypatch.setattr('run.get_order', lambda o: None)
-    monkeypatch.setattr('run.update_order', lambda order, status: None)
-    monkeypatch.setattr('run.save_order', lambda order, status: None)
-    monkeypatch.setattr('run.os.remove', lambda path: None)
+    monkeypatch.setattr('run.get_cut_file', lambda item: 'cut.pdf')
+    monkeypatch.setattr('run.upsert_order', lambda order, status: None)
 
-    def fake_start_printing(
-        order, item, pdf_path, label_settings, hotfolder_path, copy_index=0
+    def fake_print_item(
+        order, item, png_data, dpi, cut_file, label_settings, hotfolder_path, copies=1, copy_mode='files'
     ):
-        calls.append((order['id'], item['id'], copy_index))
+        calls.append((order['id'], item['id'], copies))
+        stage(hotfolder_path, order, item)
 
-    monkeypatch.setattr('run.start_printing', fake_start_printing)
+    monkeypatch.setattr('run.print_item', fake_print_item)
 
-    order_check(api, {}, '', '')
+    order_check(api, {}, str(tmp_path), '')
 
-    assert calls == [(2, 20, 0)]
+    assert calls == [(2, 20, 1)]
 
 
-def test_order_check_retries_and_succeeds(monkeypatch):
+def test_order_check_retries_and_succeeds(monkeypatch, tmp_path):
     orders_list = [
         {"id": 3, "status": "processing", "line_items": [{"id": 30}]},
     ]
@@ -79,31 +91,29 @@ def test_order_check_retries_and_succeeds(monkeypatch):
         {"code": "internal_server_error"},
         orders_list,
     ])
-    monkeypatch.setattr('run.get_order_status', lambda order: False)
-    monkeypatch.setattr('run.download_image', lambda url, path: None)
-    monkeypatch.setattr('run.png_to_pdf', lambda png, pdf, dpi: None)
+    monkeypatch.setattr('run.get_known_order_ids', lambda ids: set())
+    monkeypatch.setattr('run.fetch_image', lambda url: b'')
     monkeypatch.setattr('run.get_print_dpi', lambda item: 150)
-    monkeypatch.setattr('run.get_order', lambda o: None)
-    monkeypatch.setattr('run.update_order', lambda order, status: None)
-    monkeypatch.setattr('run.save_order', lambda order, status: None)
-    monkeypatch.setattr('run.os.remove', lambda path: None)
-    monkeypatch.setattr('run.time.sleep', lambda x: None)
+    monkeypatch.setattr('run.get_cut_file', lambda item: 'cut.pdf')
+    monkeypatch.setattr('run.upsert_order', lambda order, status: None)
+    monkeypatch.setattr('run.API_RETRY_DELAY', 0)
 
     calls = []
 
-    def fake_start_printing(
-        order, item, pdf_path, label_settings, hotfolder_path, copy_index=0
+    def fake_print_item(
+        order, item, png_data, dpi, cut_file, label_settings, hotfolder_path, copies=1, copy_mode='files'
     ):
-        calls.append((order['id'], item['id'], copy_index))
+        calls.append((order['id'], item['id'], copies))
+        stage(hotfolder_path, order, item)
 
-    monkeypatch.setattr('run.start_printing', fake_start_printing)
+    monkeypatch.setattr('run.print_item', fake_print_item)
 
-    order_check(api, {}, '', '')
+    order_check(api, {}, str(tmp_path), '')
 
-    assert calls == [(3, 30, 0)]
+    assert calls == [(3, 30, 1)]
 
 
-def test_order_check_handles_multiple_quantity(monkeypatch):
+def test_order_check_handles_multiple_quantity(monkeypatch, tmp_path):
     orders = [
         {
             "id": 4,
@@ -114,26 +124,209 @@ def test_order_check_handles_multiple_quantity(monkeypatch):
     api = FakeAPI(orders)
 
     calls = []
-    monkeypatch.setattr('run.get_order_status', lambda order: False)
-    monkeypatch.setattr('run.download_image', lambda url, path: None)
-    monkeypatch.setattr('run.png_to_pdf', lambda png, pdf, dpi: None)
+    monkeypatch.setattr('run.get_known_order_ids', lambda ids: set())
+    downloads = []
+    monkeypatch.setattr('run.fetch_image', lambda url: downloads.append(url))
     monkeypatch.setattr('run.get_print_dpi', lambda item: 150)
-    monkeypatch.setattr('run.get_order', lambda o: None)
-    monkeypatch.setattr('run.update_order', lambda order, status: None)
-    monkeypatch.setattr('run.save_order', lambda order, status: None)
-    monkeypatch.setattr('run.os.remove', lambda path: None)
+    monkeypatch.setattr('run.get_cut_file', lambda item: 'cut.pdf')
+    monkeypatch.setattr('run.upsert_order', lambda order, status: None)
 
-    def fake_start_printing(
-        order, item, pdf_path, label_settings, hotfolder_path, copy_index=0
+    def fake_print_item(
+        order, item, png_data, dpi, cut_file, label_settings, hotfolder_path, copies=1, copy_mode='files'
     ):
-        calls.append((order['id'], item['id'], copy_index))
+        calls.append((order['id'], item['id'], copies))
+        stage(hotfolder_path, order, item)
+
+    monkeypatch.setattr('run.print_item', fake_print_item)
+
+    order_check(api, {}, str(tmp_path), '')
+
+    # The item is rendered once and fanned out into three copies
+    assert calls == [(4, 40, 1)]
+    assert len(downloads) == 1
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.pdf')) == [
+        'final_4_40.pdf', 'final_4_40_1.pdf', 'final_4_40_2.pdf',
+    ]
+    assert {job['state'] for job in run.get_jobs(4)} == {'delivered'}
+
+
+class FakePagedResponse(FakeResponse):
+    def __init__(self, data, total, total_pages):
+        super().__init__(data)
+        self.headers = {'X-WP-Total': str(total), 'X-WP-TotalPages': str(total_pages)}
+
 
-    monkeypatch.setattr('run.start_printing', fake_start_printing)
+class FakePagedAPI:
+    def __init__(self, pages):
+        self._pages = pages
+        self.params = []
 
-    order_check(api, {}, '', '')
+    def get(self, endpoint, params=None):
+        assert endpoint == 'orders'
+        self.params.append(params)
+        total = sum(len(page) for page in self._pages)
+        return FakePagedResponse(self._pages[params['page'] - 1], total, len(self._pages))
+
+
+def test_order_check_incremental_follows_pages(monkeypatch, tmp_path):
+    monkeypatch.setattr('run.print_order', lambda order, *args: printed.append(order['id']))
 
-    assert calls == [
-        (4, 40, 0),
-        (4, 40, 1),
-        (4, 40, 2),
+    printed = []
+    api = FakePagedAPI([
+        [{"id": 5, "status": "processing", "line_items": [], "date_modified_gmt": "2025-09-14T11:15:00"}],
+        [{"id": 6, "status": "completed", "line_items": [], "date_modified_gmt": "2025-09-14T12:01:00"}],
+    ])
+    now = run.datetime(2025, 9, 14, 12, 0, tzinfo=run.timezone.utc).timestamp()
+    monkeypatch.setattr('run.time.time', lambda: now)
+    order_check(api, {}, '', '', incremental=True)
+
+    assert printed == [5, 6]
+    assert [params['page'] for params in api.params] == [1, 2]
+    assert api.params[0]['status'] == 'processing,completed'
+    assert api.params[0]['per_page'] == 100
+    # The first sync of an empty database only looks ORDER_SYNC_LOOKBACK back
+    assert api.params[0]['modified_after'] == "2025-09-13T11:59:59"
+    assert run.get_sync_state(run.ORDERS_MODIFIED_AFTER) == "2025-09-14T12:01:00"
+
+    api = FakePagedAPI([[]])
+    order_check(api, {}, '', '', incremental=True)
+    assert api.params[0]['modified_after'] == "2025-09-14T12:00:59"
+    assert printed == [5, 6]
+
+
+def test_failed_item_is_retried_without_blocking(monkeypatch, tmp_path):
+    order = {
+        "id": 8,
+        "status": "processing",
+        "line_items": [{"id": 80, "quantity": 2}, {"id": 81}],
+    }
+    monkeypatch.setattr('run.get_print_dpi', lambda item: 150)
+    monkeypatch.setattr('run.get_cut_file', lambda item: 'cut.pdf')
+    monkeypatch.setattr('run.time.sleep', lambda x: pytest.fail('retries must not sleep'))
+
+    def flaky_fetch(url):
+        if url.endswith('item-80.png'):
+            raise ConnectionError('connection reset')
+        return b''
+
+    monkeypatch.setattr('run.fetch_image', flaky_fetch)
+    monkeypatch.setattr('run.print_item', lambda order, item, *args: stage(args[4], order, item))
+
+    run.process_orders([order], {}, str(tmp_path), '')
+
+    # The healthy item is delivered, the broken one waits for its retry
+    assert os.path.exists(tmp_path / 'final_8_81.pdf')
+    jobs = {(job['item_id'], job['copy']): job for job in run.get_jobs(8)}
+    assert jobs[(81, 0)]['state'] == 'delivered'
+    assert jobs[(80, 0)]['state'] == 'queued'
+    assert jobs[(80, 0)]['attempts'] == 1
+    assert jobs[(80, 0)]['next_attempt_at'] > run.time.time()
+    assert run.get_order(order) is None
+
+    # Nothing is due before the backoff has passed
+    assert run.get_due_orders() == []
+
+    monkeypatch.setattr('run.fetch_image', lambda url: b'')
+    later = run.time.time() + run.JOB_RETRY_DELAY
+    monkeypatch.setattr('run.time.time', lambda: later)
+    run.run_due_jobs({}, str(tmp_path), '')
+
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith('final_8_')) == [
+        'final_8_80.pdf', 'final_8_80_1.pdf', 'final_8_81.pdf',
     ]
+    assert run.get_order(order)['status'] is True
+    assert os.listdir(run.STAGING_PATH) == []
+
+
+def test_jobs_resume_after_restart(monkeypatch, tmp_path):
+    order = {"id": 9, "status": "processing", "line_items": [{"id": 90, "quantity": 3}]}
+    run.enqueue_order(order)
+    # A previous run rendered the item and delivered the first copy before it stopped
+    os.makedirs(run.STAGING_PATH)
+    stage(run.STAGING_PATH, order, order['line_items'][0])
+    run.set_job_state(9, 90, [0, 1, 2], 'rendered')
+    run.set_job_state(9, 90, [0], 'delivered')
+
+    monkeypatch.setattr('run.fetch_image', lambda url: pytest.fail('rendered items are not downloaded again'))
+    run.resume_jobs()
+    run.run_due_jobs({}, str(tmp_path), '')
+
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.pdf')) == [
+        'final_9_90_1.pdf', 'final_9_90_2.pdf',
+    ]
+    assert run.get_order(order)['status'] is True
+
+
+def test_jobs_fail_after_max_attempts(monkeypatch, tmp_path):
+    order = {"id": 10, "status": "processing", "line_items": [{"id": 100}]}
+
+    def broken_fetch(url):
+        raise ConnectionError('offline')
+
+    monkeypatch.setattr('run.fetch_image', broken_fetch)
+    now = run.time.time()
+    for attempt in range(run.JOB_MAX_ATTEMPTS):
+        monkeypatch.setattr('run.time.time', lambda: now + attempt * run.JOB_MAX_DELAY)
+        run.print_order(order, {}, str(tmp_path), '')
+
+    assert run.get_jobs(10)[0]['state'] == 'failed'
+    assert run.get_jobs(10)[0]['error'] == 'offline'
+    assert run.get_db().execute("SELECT status FROM orders WHERE id = 10").fetchone() == (-1,)
+    assert run.next_job_due() is None
+
+
+def test_full_hotfolder_holds_jobs_and_releases_express_first(monkeypatch, tmp_path):
+    hotfolder = tmp_path / 'hotfolder'
+    hotfolder.mkdir()
+    # The RIP has not taken this job yet
+    (hotfolder / 'final_1_10.pdf').write_bytes(b'%PDF')
+    orders = [
+        {"id": 11, "status": "processing", "line_items": [{"id": 110}]},
+        {
+            "id": 12,
+            "status": "processing",
+            "line_items": [{"id": 120}],
+            "shipping_lines": [{"method_id": "flat_rate", "method_title": "Express-Versand"}],
+        },
+    ]
+    monkeypatch.setattr('run.HOTFOLDER_MAX_FILES', 1)
+    monkeypatch.setattr('run.fetch_image', lambda url: b'')
+    monkeypatch.setattr('run.get_print_dpi', lambda item: 150)
+    monkeypatch.setattr('run.get_cut_file', lambda item: 'cut.pdf')
+    monkeypatch.setattr('run.print_item', lambda order, item, *args: stage(args[4], order, item))
+
+    run.process_orders(orders, {}, str(hotfolder), '')
+
+    assert [job['state'] for job in run.get_jobs(11) + run.get_jobs(12)] == ['held', 'held']
+    assert os.listdir(hotfolder) == ['final_1_10.pdf']
+    assert run.hotfolder_usage(str(hotfolder)) == (1, 4)
+
+    # The RIP takes its job, there is room for one more
+    (hotfolder / 'final_1_10.pdf').unlink()
+    later = run.time.time() + run.HOTFOLDER_POLL
+    monkeypatch.setattr('run.time.time', lambda: later)
+    run.run_due_jobs({}, str(hotfolder), '')
+
+    assert os.listdir(hotfolder) == ['final_12_120.pdf']
+    assert run.get_jobs(11)[0]['state'] == 'held'
+
+    (hotfolder / 'final_12_120.pdf').unlink()
+    later += run.HOTFOLDER_POLL
+    run.run_due_jobs({}, str(hotfolder), '')
+
+    assert os.listdir(hotfolder) == ['final_11_110.pdf']
+    assert run.get_order(orders[0])['status'] is True
+    assert 'print_stage_duration_seconds_count{stage="hotfolder_wait"}' in run.render_metrics()
+    assert 'held_jobs 0' in run.render_metrics()
+
+
+def test_first_incremental_sync_starts_at_the_newest_stored_order(monkeypatch):
+    monkeypatch.setattr('run.print_order', lambda order, *args: None)
+    with run.get_db() as conn:
+        conn.execute("INSERT INTO orders (id, status, created_at) VALUES (1, 1, '2025-09-10 08:30:00')")
+
+    api = FakePagedAPI([[]])
+    order_check(api, {}, '', '', incremental=True)
+
+    assert api.params[0]['modified_after'] == "2025-09-10T08:29:59"
+    assert run.get_sync_state(run.ORDERS_MODIFIED_AFTER) == "2025-09-10T08:30:00"
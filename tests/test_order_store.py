@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+
+def test_upsert_order_inserts_and_updates(job_db):
+    assert run.get_order({'id': 1}) is None
+
+    run.upsert_order({'id': 1}, -1)
+    run.upsert_order({'id': 1}, True)
+
+    order = run.get_order({'id': 1})
+    assert order['id'] == 1
+    assert order['status'] is True
+    assert len(run.get_orders()) == 1
+
+
+def test_get_known_order_ids(job_db):
+    for order_id in range(0, 2000, 2):
+        run.upsert_order({'id': order_id}, True)
+
+    assert run.get_known_order_ids([1, 2, 3, 4]) == {2, 4}
+    assert run.get_known_order_ids(range(2000)) == set(range(0, 2000, 2))
+    assert run.get_known_order_ids([]) == set()
@@ -15,3 +15,72 @@ def test_png_to_pdf_respects_dpi(tmp_path):
     assert page.rect.width == pytest.approx((100 / 200) * 72)
     assert page.rect.height == pytest.approx((100 / 200) * 72)
     doc.close()
+
+
+def render_center(pdf_path):
+    doc = fitz.open(str(pdf_path))
+    pix = doc[0].get_pixmap(dpi=72)
+    pixel = pix.pixel(pix.width // 2, pix.height // 2)
+    doc.close()
+    return pixel
+
+
+def test_png_to_pdf_embeds_rgb_without_reencoding(tmp_path):
+    img_path = tmp_path / "input.png"
+    pdf_path = tmp_path / "output.pdf"
+    Image.new("RGB", (100, 100), color=(10, 200, 30)).save(img_path)
+    png_to_pdf(str(img_path), str(pdf_path), dpi=72)
+    doc = fitz.open(str(pdf_path))
+    xref = doc[0].get_images()[0][0]
+    assert doc.xref_get_key(xref, "Filter") == ("name", "/FlateDecode")
+    assert "/Predictor 15" in doc.xref_get_key(xref, "DecodeParms")[1]
+    doc.close()
+    assert render_center(pdf_path) == (10, 200, 30)
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "LA", "P"])
+def test_png_to_pdf_flattens_alpha_onto_white(tmp_path, mode):
+    img_path = tmp_path / "input.png"
+    pdf_path = tmp_path / "output.pdf"
+    Image.new("RGBA", (100, 100), color=(255, 0, 0, 0)).convert(mode).save(img_path)
+    png_to_pdf(str(img_path), str(pdf_path), dpi=72)
+    assert render_center(pdf_path) == (255, 255, 255)
+
+
+@pytest.mark.parametrize("mode", ["P", "L", "I;16"])
+def test_png_to_pdf_converts_other_modes(tmp_path, mode):
+    img_path = tmp_path / "input.png"
+    pdf_path = tmp_path / "output.pdf"
+    Image.new("RGB", (100, 100), color=(0, 0, 255)).convert(mode).save(img_path)
+    png_to_pdf(str(img_path), str(pdf_path), dpi=72)
+    assert render_center(pdf_path) == Image.open(img_path).convert("RGB").getpixel((50, 50))
+
+
+@pytest.mark.parametrize("encoding, expected", [
+    ("jpeg", "/DCTDecode"),
+    # A flat colour compresses far better without loss
+    ("auto", "/FlateDecode"),
+])
+def test_png_to_pdf_image_encoding(tmp_path, monkeypatch, encoding, expected):
+    monkeypatch.setattr("run.PDF_IMAGE_ENCODING", encoding)
+    img_path = tmp_path / "input.png"
+    pdf_path = tmp_path / "output.pdf"
+    Image.new("RGBA", (100, 100), color=(10, 200, 30, 255)).save(img_path)
+    png_to_pdf(str(img_path), str(pdf_path), dpi=72)
+    doc = fitz.open(str(pdf_path))
+    xref = doc[0].get_images()[0][0]
+    assert doc.xref_get_key(xref, "Filter") == ("name", expected)
+    doc.close()
+    red, green, blue = render_center(pdf_path)
+    assert abs(red - 10) < 8 and abs(green - 200) < 8 and abs(blue - 30) < 8
+
+
+def test_png_to_pdf_auto_picks_jpeg_for_photos(tmp_path, monkeypatch):
+    monkeypatch.setattr("run.PDF_IMAGE_ENCODING", "auto")
+    img_path = tmp_path / "input.png"
+    pdf_path = tmp_path / "output.pdf"
+    Image.effect_noise((200, 200), 40).convert("RGB").save(img_path)
+    png_to_pdf(str(img_path), str(pdf_path), dpi=72)
+    doc = fitz.open(str(pdf_path))
+    assert doc.xref_get_key(doc[0].get_images()[0][0], "Filter") == ("name", "/DCTDecode")
+    doc.close()
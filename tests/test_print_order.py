@@ -0,0 +1,197 @@
+import io
+import os
+import sys
+import fitz
+import pytest
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+CUT_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'cuts',
+    '2_final-mavic-3-pro-cut.pdf',
+)
+
+LABEL_SETTINGS = {
+    'text_font_size': '9',
+    'text_sender_pos': '150, 50',
+    'text_receiver_pos': '150, 230',
+    'sender_name': 'Drohnen-Design',
+    'sender_street': 'Herrenstraße 14',
+    'sender_postalcode': '21698',
+    'sender_city': 'Harsefeld',
+    'sender_country': 'Deutschland',
+}
+
+ORDER = {
+    'id': 7,
+    'shipping': {
+        'first_name': 'Erika',
+        'last_name': 'Musterfrau',
+        'address_1': 'Musterstraße 1',
+        'postcode': '12345',
+        'city': 'Köln',
+        'country': 'DE',
+    },
+    'line_items': [{'id': 70, 'quantity': 2}, {'id': 71}],
+}
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (300, 150), 'red').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_print_order_parallel_pipeline(monkeypatch, tmp_path, job_db):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'temp').mkdir()
+    hotfolder = tmp_path / 'hotfolder'
+    hotfolder.mkdir()
+
+    downloaded = []
+
+    async def fake_fetch(url):
+        downloaded.append(url)
+        return png_bytes()
+
+    monkeypatch.setattr(run, 'fetch_image_async', fake_fetch)
+    monkeypatch.setattr(run, 'get_print_dpi', lambda item: 150)
+    monkeypatch.setattr(run, 'get_cut_file', lambda item: CUT_FILE)
+    # Spawned render workers have to get the output settings passed on
+    monkeypatch.setattr(run, 'PDF_IMAGE_ENCODING', 'jpeg')
+
+    run.print_order(ORDER, LABEL_SETTINGS, str(hotfolder), 'http://shop', max_workers=2)
+
+    assert sorted(os.listdir(hotfolder)) == [
+        'final_7_70.pdf',
+        'final_7_70_1.pdf',
+        'final_7_71.pdf',
+    ]
+    assert len(downloaded) == 2
+    assert os.listdir(tmp_path / 'temp' / 'staging') == []
+    assert not [name for name in os.listdir(hotfolder) if name.endswith('.part')]
+    doc = fitz.open(str(hotfolder / 'final_7_71.pdf'))
+    assert len(doc) == 1
+    assert doc.extract_image(doc[0].get_images()[0][0])['ext'] == 'jpeg'
+    doc.close()
+
+
+def test_print_order_downloads_only_as_many_items_as_it_renders(monkeypatch, tmp_path, job_db):
+    monkeypatch.chdir(tmp_path)
+    hotfolder = tmp_path / 'hotfolder'
+    hotfolder.mkdir()
+    order = {**ORDER, 'line_items': [{'id': item} for item in range(80, 86)]}
+
+    in_flight = []
+    set_job_state = run.set_job_state
+
+    async def fake_fetch(url):
+        in_flight.append(url)
+        return png_bytes()
+
+    def track_state(order_id, item_id, copies, state):
+        if state == 'rendered':
+            in_flight.pop()
+        set_job_state(order_id, item_id, copies, state)
+
+    monkeypatch.setattr(run, 'fetch_image_async', fake_fetch)
+    monkeypatch.setattr(run, 'set_job_state', track_state)
+    monkeypatch.setattr(run, 'get_print_dpi', lambda item: 150)
+    monkeypatch.setattr(run, 'get_cut_file', lambda item: CUT_FILE)
+    monkeypatch.setattr(run, 'RENDER_CACHE_SIZE', 0)
+    peak = []
+    monkeypatch.setattr(run, 'load_render', lambda key, path: peak.append(len(in_flight)))
+
+    run.print_order(order, LABEL_SETTINGS, str(hotfolder), 'http://shop', max_workers=2)
+
+    assert len(os.listdir(hotfolder)) == 6
+    assert in_flight == []
+    assert max(peak) <= 2
+
+
+def test_print_order_multipage_copies(monkeypatch, tmp_path, job_db):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'temp').mkdir()
+    hotfolder = tmp_path / 'hotfolder'
+    hotfolder.mkdir()
+
+    monkeypatch.setattr(run, 'fetch_image', lambda url: png_bytes())
+    monkeypatch.setattr(run, 'get_print_dpi', lambda item: 150)
+    monkeypatch.setattr(run, 'get_cut_file', lambda item: CUT_FILE)
+
+    order = dict(ORDER, line_items=[{'id': 70, 'quantity': 3}])
+    run.print_order(order, LABEL_SETTINGS, str(hotfolder), 'http://shop', copy_mode='multipage')
+
+    assert os.listdir(hotfolder) == ['final_7_70.pdf']
+    doc = fitz.open(str(hotfolder / 'final_7_70.pdf'))
+    assert len(doc) == 3
+    doc.close()
+
+
+def test_save_pdf_atomic_leaves_no_partial_file(tmp_path):
+    doc = fitz.open()
+    doc.new_page()
+    target = tmp_path / 'final.pdf'
+
+    run.save_pdf_atomic(doc, str(target))
+    assert os.listdir(tmp_path) == ['final.pdf']
+
+    doc.close()
+    try:
+        # A closed document cannot be saved
+        run.save_pdf_atomic(doc, str(tmp_path / 'broken.pdf'))
+    except Exception:
+        pass
+    assert os.listdir(tmp_path) == ['final.pdf']
+
+
+def test_reprint_is_served_from_the_render_cache(monkeypatch, tmp_path, job_db):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'temp').mkdir()
+    hotfolder = tmp_path / 'hotfolder'
+    hotfolder.mkdir()
+
+    monkeypatch.setattr(run, 'fetch_image', lambda url: png_bytes())
+    monkeypatch.setattr(run, 'get_print_dpi', lambda item: 150)
+    monkeypatch.setattr(run, 'get_cut_file', lambda item: CUT_FILE)
+    rendered = []
+    print_item = run.print_item
+
+    def counting_print_item(order, item, *args):
+        rendered.append(item['id'])
+        print_item(order, item, *args)
+
+    monkeypatch.setattr(run, 'print_item', counting_print_item)
+
+    order = dict(ORDER, line_items=[{'id': 71}])
+    run.print_order(order, LABEL_SETTINGS, str(hotfolder), 'http://shop')
+    first = (hotfolder / 'final_7_71.pdf').read_bytes()
+    (hotfolder / 'final_7_71.pdf').unlink()
+
+    # Same artwork and address: copied from the cache
+    run.print_order(dict(order, id=8), LABEL_SETTINGS, str(hotfolder), 'http://shop')
+    assert rendered == [71]
+    assert (hotfolder / 'final_8_71.pdf').read_bytes() == first
+
+    # A different address is a different document
+    moved = dict(order, id=9, shipping=dict(ORDER['shipping'], city='Bonn'))
+    run.print_order(moved, LABEL_SETTINGS, str(hotfolder), 'http://shop')
+    assert rendered == [71, 71]
+    assert (hotfolder / 'final_9_71.pdf').read_bytes() != first
+
+
+def test_render_cache_evicts_least_recently_used(monkeypatch, tmp_path):
+    monkeypatch.setattr(run, 'RENDER_CACHE_PATH', str(tmp_path))
+    for age, name in enumerate(['old', 'used', 'new']):
+        path = tmp_path / f'{name}.pdf'
+        path.write_bytes(b'x' * 100)
+        os.utime(path, (age, age))
+    assert run.load_render('old', str(tmp_path / 'reprint.pdf'))
+    os.remove(tmp_path / 'reprint.pdf')
+
+    run.evict_renders(max_size=200)
+
+    assert sorted(os.listdir(tmp_path)) == ['new.pdf', 'old.pdf']
@@ -0,0 +1,78 @@
+import os
+import sys
+from collections import OrderedDict
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class FakeProductAPI:
+    def __init__(self):
+        self.calls = []
+
+    def get(self, endpoint, params=None):
+        self.calls.append((endpoint, params))
+        if endpoint == 'products':
+            ids = params['include'].split(',')
+            return FakeResponse([self.product(int(product_id)) for product_id in ids])
+        return FakeResponse(self.product(int(endpoint.split('/')[1])))
+
+    @staticmethod
+    def product(product_id):
+        return {'id': product_id, 'meta_data': [{'key': '_dvpd_dpi', 'value': '300'}]}
+
+
+@pytest.fixture
+def api(job_db, monkeypatch):
+    api = FakeProductAPI()
+    monkeypatch.setattr(run, 'WOOCOMMERCE_API', api, raising=False)
+    monkeypatch.setattr(run, 'PRODUCT_CACHE', OrderedDict())
+    monkeypatch.setattr(run, 'PRODUCT_CACHE_STATS', {'hits': 0, 'misses': 0})
+    return api
+
+
+def test_prefetch_products_uses_one_request(api):
+    run.prefetch_products([1, 2, 3, 2])
+
+    assert api.calls == [('products', {'include': '1,2,3', 'per_page': 3})]
+    assert run.get_print_dpi({'product_id': 2}) == 300
+    assert run.PRODUCT_CACHE_STATS == {'hits': 1, 'misses': 0}
+    assert len(api.calls) == 1
+
+
+def test_product_cache_survives_restart(api, monkeypatch):
+    run._get_product(5)
+    monkeypatch.setattr(run, 'PRODUCT_CACHE', OrderedDict())
+
+    run._get_product(5)
+
+    assert api.calls == [('products/5', None)]
+    assert run.PRODUCT_CACHE_STATS == {'hits': 1, 'misses': 1}
+
+
+def test_product_cache_expires(api, monkeypatch):
+    run._get_product(5)
+    monkeypatch.setattr(run, 'PRODUCT_CACHE_TTL', -1)
+
+    run._get_product(5)
+
+    assert len(api.calls) == 2
+    assert run.PRODUCT_CACHE_STATS == {'hits': 0, 'misses': 2}
+
+
+def test_product_cache_is_bounded(api, monkeypatch):
+    monkeypatch.setattr(run, 'PRODUCT_CACHE_SIZE', 2)
+    for product_id in (1, 2, 3):
+        run._get_product(product_id)
+
+    assert list(run.PRODUCT_CACHE) == [2, 3]
@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import hmac
+import os
+import queue
+import sys
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import run
+
+SECRET = 'cs_test'
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'order_created.json')
+
+
+def sign(body):
+    return base64.b64encode(hmac.new(SECRET.encode(), body, hashlib.sha256).digest()).decode()
+
+
+@pytest.fixture
+def webhook_server():
+    order_queue = queue.Queue()
+    server = run.start_webhook_server('127.0.0.1', 0, SECRET, order_queue)
+    yield server, order_queue
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, body, headers):
+    host, port = server.server_address
+    request = urllib.request.Request(f'http://{host}:{port}/', data=body, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def test_webhook_queues_signed_order(webhook_server):
+    server, order_queue = webhook_server
+    with open(FIXTURE, 'rb') as fixture:
+        body = fixture.read()
+
+    status = post(server, body, {
+        'X-WC-Webhook-Topic': 'order.created',
+        'X-WC-Webhook-Signature': sign(body),
+    })
+
+    assert status == 202
+    orders = run.wait_for_orders(order_queue, 1)
+    assert [order['id'] for order in orders] == [1002]
+
+
+def test_webhook_rejects_bad_signature(webhook_server):
+    server, order_queue = webhook_server
+    with open(FIXTURE, 'rb') as fixture:
+        body = fixture.read()
+
+    status = post(server, body, {
+        'X-WC-Webhook-Topic': 'order.created',
+        'X-WC-Webhook-Signature': sign(b'something else'),
+    })
+
+    assert status == 401
+    assert order_queue.empty()
+
+
+def test_webhook_answers_ping(webhook_server):
+    server, order_queue = webhook_server
+    assert post(server, b'webhook_id=12', {}) == 200
+    assert order_queue.empty()
+
+
+def test_wait_for_orders_keeps_latest_version():
+    order_queue = queue.Queue()
+    order_queue.put({'id': 1, 'status': 'pending'})
+    order_queue.put({'id': 2, 'status': 'processing'})
+    order_queue.put({'id': 1, 'status': 'processing'})
+
+    orders = run.wait_for_orders(order_queue, 0)
+
+    assert orders == [{'id': 1, 'status': 'processing'}, {'id': 2, 'status': 'processing'}]
+    assert run.wait_for_orders(order_queue, 0) == []